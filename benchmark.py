@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+
+"""
+**Benchmarks**
+
+Times every puzzle solver over a ladder of problem sizes, along with the
+slower reference versions of the solvers that have them.
+
+Each case runs in a fresh Python process so that its peak memory (max resident
+set size) is measured on its own and nothing is cached between cases. The
+results can be saved as a baseline and later runs compared against it; the
+run fails if any result changes or any case gets slower than the baseline by
+more than the tolerance.
+
+The startup cases time importing each module in a fresh interpreter (what
+every command line run pays before doing any work), and their results are the
+heavy dependencies that got imported, which should be none.
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+# Dependencies that are slow to import, so should only be imported when used.
+HEAVY_MODULES = ('numpy', 'multiprocessing')
+
+
+Case = collections.namedtuple('Case', 'module function params reference')
+Case.__doc__ = """A benchmark case.
+
+Attributes:
+  module: The name of the module being benchmarked.
+  function: The name of a bench_* function in this module to run.
+  params: A dict of keyword arguments for the function.
+  reference: If not None, the name of another case that must have the same
+      result.
+"""
+
+
+def case_name(case):
+  """Gets a unique name for a case."""
+  return '{}.{}[{}]'.format(
+      case.module, case.function[len('bench_'):],
+      ','.join('{}={}'.format(k, v) for k, v in sorted(case.params.items())))
+
+
+def bench_startup(name):
+  # Import in a fresh interpreter, which is what each command line run pays.
+  code = ('import sys, {}; print(*(name for name in {!r} '
+          'if name in sys.modules))').format(name, HEAVY_MODULES)
+  output = subprocess.run([sys.executable, '-c', code], check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+  # The heavy dependencies that were loaded (which should be none).
+  return output.stdout.split()
+
+
+def bench_fuel_required(distance, tank):
+  import mpmp2
+  return mpmp2.fuel_required(distance, tank)
+
+
+def bench_fuel_required_rec(distance, tank):
+  import mpmp2
+  return mpmp2.fuel_required_rec(distance, tank)
+
+
+def bench_value_hands_fast(value, hand_size):
+  import mpmp3
+  # Time the counting, not the combinations memoized by earlier runs.
+  mpmp3._point_combinations.cache_clear()
+  return int(mpmp3.value_hands_fast(value, hand_size=hand_size))
+
+
+def bench_value_hands_slow(value, hand_size):
+  import mpmp3
+  return mpmp3.value_hands_slow(value, hand_size=hand_size)
+
+
+def bench_test_flips(cards):
+  import mpmp4
+  with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+    return mpmp4.test_flips(mpmp4.graycode(cards), cards=cards, summary=True)
+
+
+def bench_write_states(cards):
+  import mpmp4
+  flips = list(mpmp4.graycode(cards))
+  with open(os.devnull, 'w') as f:
+    mpmp4.write_states(mpmp4.do_flips(flips), flips, cards, file=f)
+  return len(flips)
+
+
+def bench_solve_flips(cards):
+  import mpmp4
+  return len(mpmp4.solve_flips(cards))
+
+
+def bench_triangle_solve(rows, start):
+  import mpmp5
+  solutions = mpmp5.Triangle(rows, start).solve()
+  return [len(solutions), len(solutions[0]) if solutions else None]
+
+
+def bench_shortest_solution(rows, start):
+  import mpmp5
+  solution = mpmp5.Triangle(rows, start).shortest_solution()
+  return len(solution) if solution else None
+
+
+def bench_retrograde_table(rows, start):
+  import mpmp5
+  table = mpmp5.retrograde_table(rows)
+  entry = table[mpmp5.Triangle(mpmp5.Triangle(rows), start).bits]
+  if entry['moves'] == mpmp5.UNSOLVABLE:
+    return [0, None]
+  return [int(entry['solutions']), int(entry['moves']) + 1]
+
+
+def bench_find_deposits(total):
+  import mpmp6
+  return list(mpmp6.find_deposits(total))
+
+
+def bench_count_deposits(total):
+  import mpmp6
+  return str(mpmp6.count_deposits(total))
+
+
+def bench_find_deposits_batch(count, max_total):
+  import random
+  import mpmp6
+  rng = random.Random(0)
+  totals = [rng.randrange(1, max_total) for _ in range(count)]
+  results = mpmp6.find_deposits_batch(totals)
+  # Summarize so the result stays small.
+  return sum(n for _, _, n in filter(None, results))
+
+
+def bench_grid_solve(n):
+  import mpmp7
+  return sum(1 for _ in mpmp7.Grid(n).solve())
+
+
+def _cases():
+  """Builds the list of all benchmark cases."""
+  cases = []
+
+  def add(module, function, reference=None, **params):
+    case = Case(module, function, params, reference)
+    cases.append(case)
+    return case_name(case)
+
+  for module in ('mpmp',) + tuple('mpmp{}'.format(i) for i in range(2, 8)):
+    add(module, 'bench_startup', name=module)
+
+  # The number of stops (and so the work) grows like
+  # e ** (2 * distance / tank), so grow the ratio rather than the distance.
+  # Each step is about 7 times the work, up to 1.2 million stops.
+  for distance in (800, 1500, 2000, 2500, 3000, 3500, 4000):
+    fast = add('mpmp2', 'bench_fuel_required', distance=distance, tank=500)
+    # The recursive version recurses once per stop, so stay under the
+    # recursion limit.
+    if distance <= 2000:
+      add('mpmp2', 'bench_fuel_required_rec', fast, distance=distance,
+          tank=500)
+
+  for hand_size in range(3, 8):
+    fast = add('mpmp3', 'bench_value_hands_fast', value=46 * hand_size // 7,
+               hand_size=hand_size)
+    if hand_size <= 5:
+      add('mpmp3', 'bench_value_hands_slow', fast, value=46 * hand_size // 7,
+          hand_size=hand_size)
+
+  for cards in range(10, 25, 2):
+    add('mpmp4', 'bench_test_flips', cards=cards)
+    # Formatting 16 million lines for 24 cards takes minutes.
+    if cards <= 22:
+      add('mpmp4', 'bench_write_states', cards=cards)
+  for cards in range(2, 9):
+    add('mpmp4', 'bench_solve_flips', cards=cards)
+
+  for rows in range(4, 7):
+    start = 2 if rows == 4 else 1
+    if rows <= 5:
+      add('mpmp5', 'bench_triangle_solve', rows=rows, start=start)
+    add('mpmp5', 'bench_shortest_solution', rows=rows, start=start)
+    add('mpmp5', 'bench_retrograde_table', rows=rows, start=start)
+
+  for exponent in range(6, 31, 4):
+    add('mpmp6', 'bench_find_deposits', total=10 ** exponent)
+    add('mpmp6', 'bench_count_deposits', total=10 ** exponent)
+  for exponent in (6, 12, 18):
+    add('mpmp6', 'bench_find_deposits_batch', count=100000,
+        max_total=10 ** exponent)
+  # Totals too big for NumPy are much slower.
+  add('mpmp6', 'bench_find_deposits_batch', count=10000, max_total=10 ** 30)
+
+  for n in range(4, 8):
+    add('mpmp7', 'bench_grid_solve', n=n)
+
+  return cases
+
+
+CASES = _cases()
+
+# Cases faster than this many seconds are run repeatedly and averaged.
+MIN_TIMING = 0.1
+
+
+def run_case(name):
+  """Runs a single case in this process.
+
+  Returns:
+    A dict with the case's result, wall time in seconds and peak memory in
+    bytes (or None if it can't be measured on this platform).
+  """
+  case = {case_name(case): case for case in CASES}[name]
+  function = globals()[case.function]
+  # Don't count importing the module, or NumPy (which it imports lazily).
+  __import__(case.module)
+  try:
+    import numpy
+  except ImportError:
+    pass
+  start = time.perf_counter()
+  result = function(**case.params)
+  seconds = time.perf_counter() - start
+  if seconds < MIN_TIMING:
+    # Too quick to time once, so average over enough runs.
+    runs = min(int(MIN_TIMING / max(seconds, 1e-6)) + 1, 100000)
+    start = time.perf_counter()
+    for _ in range(runs):
+      function(**case.params)
+    seconds = (time.perf_counter() - start) / runs
+  peak = None
+  if resource is not None:
+    # Include any processes the case ran (like bench_startup()).
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports KiB, macOS reports bytes.
+    if sys.platform != 'darwin':
+      peak *= 1024
+  return {'result': result, 'seconds': seconds, 'peak_memory': peak}
+
+
+def run_isolated(name):
+  """Runs a single case in a new Python process (see run_case())."""
+  output = subprocess.run(
+      [sys.executable, os.path.abspath(__file__), '--run-case', name],
+      check=True, stdout=subprocess.PIPE,
+      cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+  return json.loads(output)
+
+
+def compare(results, baseline, tolerance, min_seconds):
+  """Checks results against each other and a baseline.
+
+  Args:
+    results: A dict of case name to run_case() results.
+    baseline: A dict of previous results, or None.
+    tolerance: The fraction a case can get slower than the baseline.
+    min_seconds: Slowdowns smaller than this are ignored as noise.
+  Returns:
+    A list of failure messages.
+  """
+  failures = []
+  for case in CASES:
+    name = case_name(case)
+    if name not in results:
+      continue
+    result = results[name]
+    if case.reference in results:
+      if result['result'] != results[case.reference]['result']:
+        failures.append('{}: result {!r} != {!r} from {}'.format(
+            name, result['result'], results[case.reference]['result'],
+            case.reference))
+    if baseline and name in baseline:
+      expected = baseline[name]
+      if result['result'] != expected['result']:
+        failures.append('{}: result {!r} != baseline {!r}'.format(
+            name, result['result'], expected['result']))
+      limit = max(expected['seconds'] * (1 + tolerance),
+                  expected['seconds'] + min_seconds)
+      if result['seconds'] > limit:
+        failures.append('{}: {:.3f}s > baseline {:.3f}s'.format(
+            name, result['seconds'], expected['seconds']))
+  return failures
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-m', '--module', action='append',
+                      help='Only run cases for this module (can be repeated)')
+  parser.add_argument('-k', '--filter',
+                      help='Only run cases with this substring in their name')
+  parser.add_argument('-l', '--list', action='store_true',
+                      help='List the cases instead of running them')
+  parser.add_argument('-o', '--output',
+                      help='Write the results as JSON to this file')
+  parser.add_argument('-b', '--baseline',
+                      help='Compare against the results in this JSON file')
+  parser.add_argument('--save-baseline', action='store_true',
+                      help='Write the results to the baseline file instead '
+                           'of comparing')
+  parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                      help='Fraction a case can be slower than the baseline')
+  parser.add_argument('--min-seconds', type=float, default=0.05,
+                      help='Ignore slowdowns smaller than this')
+  parser.add_argument('--run-case', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  # Don't let a typo quietly skip the comparison.
+  if args.save_baseline and not args.baseline:
+    parser.error('--save-baseline needs -b/--baseline')
+  if (args.baseline and not args.save_baseline and
+      not os.path.exists(args.baseline)):
+    parser.error('baseline file not found: {} (use --save-baseline to create '
+                 'it)'.format(args.baseline))
+
+  if args.run_case:
+    json.dump(run_case(args.run_case), sys.stdout)
+    sys.exit()
+
+  cases = [case_name(case) for case in CASES
+           if not args.module or case.module in args.module]
+  if args.filter:
+    cases = [name for name in cases if args.filter in name]
+  if args.list:
+    print('\n'.join(cases))
+    sys.exit()
+
+  results = {}
+  for name in cases:
+    result = results[name] = run_isolated(name)
+    print('{:60} {:12.6f}s {:8.1f}MB'.format(
+        name, result['seconds'], (result['peak_memory'] or 0) / 2 ** 20),
+        flush=True)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+  baseline = None
+  if args.baseline:
+    if args.save_baseline:
+      with open(args.baseline, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    else:
+      with open(args.baseline) as f:
+        baseline = json.load(f)
+
+  failures = compare(results, baseline, args.tolerance, args.min_seconds)
+  for failure in failures:
+    print('FAIL', failure)
+  sys.exit(1 if failures else 0)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""
+**Matt Parker's Maths Puzzles**
+
+A single entry point for all the puzzle scripts, e.g. ``mpmp.py bank 1000``
+is the same as ``mpmp6.py 1000``.
+
+Only the chosen puzzle's module is imported, and the modules themselves only
+import heavy dependencies (NumPy, multiprocessing) when they're needed, so
+short queries start quickly.
+"""
+
+import importlib
+import sys
+
+
+# Subcommand: (module, description).
+COMMANDS = {
+    'train': ('mpmp2', 'Steam Train Puzzle'),
+    'scrabble': ('mpmp3', 'Scrabble Puzzle'),
+    'cards': ('mpmp4', 'Card Puzzle'),
+    'coins': ('mpmp5', 'Coin Puzzle'),
+    'bank': ('mpmp6', 'Million Bank Balance Puzzle'),
+    'distance': ('mpmp7', 'Unique Distancing Puzzle'),
+    'serve': ('server', 'Query server for all the puzzles'),
+}
+
+
+def usage(file):
+  print('usage: mpmp.py <command> [args...]', file=file)
+  print(file=file)
+  print('commands:', file=file)
+  for command, (module, description) in COMMANDS.items():
+    print('  {:10}{} ({})'.format(command, description, module), file=file)
+  print(file=file)
+  print('Use mpmp.py <command> -h for help with a command.', file=file)
+
+
+def main(argv=None):
+  """Runs a puzzle's command line interface.
+
+  Args:
+    argv: The command line arguments, starting with the subcommand (defaults
+        to sys.argv[1:]). Modules names (e.g. mpmp6) work as subcommands too.
+  """
+  if argv is None:
+    argv = sys.argv[1:]
+  if not argv or argv[0] in ('-h', '--help'):
+    usage(sys.stdout if argv else sys.stderr)
+    return 0 if argv else 2
+  command = argv[0]
+  modules = {module: module for module, _ in COMMANDS.values()}
+  if command in COMMANDS:
+    module = COMMANDS[command][0]
+  elif command in modules:
+    module = command
+  else:
+    usage(sys.stderr)
+    print('mpmp.py: error: unknown command: {}'.format(command),
+          file=sys.stderr)
+    return 2
+  return importlib.import_module(module).main(
+      argv[1:], prog='mpmp.py {}'.format(command))
+
+
+if __name__ == '__main__':
+  sys.exit(main())
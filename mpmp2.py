@@ -118,6 +118,8 @@ require a full tank. Therefore, the total is C * n + Sn * (2n + 1).
 
 import argparse
 
+import resultcache
+
 
 def fuel_required_rec(d, c, n=0):
   """Calculates the amount of fuel required for a train to a distance.
@@ -158,13 +160,28 @@ def fuel_required(d, c, n=0):
   return c * n + d * (2 * n + 1)
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('-t', '--tank', type=int, default=500,
                       help='Train fuel tank capacity')
   parser.add_argument('distance', type=int, nargs='?', default=800,
                       help='Distance to travel')
-  args = parser.parse_args()
-
-  fuel = fuel_required(args.distance, args.tank)
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
+
+  fuel = resultcache.cached(
+      'mpmp2', __file__, {'distance': args.distance, 'tank': args.tank},
+      lambda: fuel_required(args.distance, args.tank),
+      enabled=not args.no_cache)
   print('{:.2f}'.format(fuel))
+
+
+if __name__ == '__main__':
+  main()
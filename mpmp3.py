@@ -15,10 +15,7 @@ import functools
 import itertools
 import operator
 
-try:
-  import numpy as np
-except ImportError:
-  pass
+import resultcache
 
 
 POINTS = {
@@ -95,6 +92,7 @@ def distinct_combinations(values, r):
   Returns:
     The number of distinct ways to select r items from values.
   """
+  import numpy as np
   values = collections.Counter(values)
   p = [1]
   for c in values.values():
@@ -102,6 +100,25 @@ def distinct_combinations(values, r):
   return p[r]
 
 
+@functools.lru_cache()
+def tiles_with_points():
+  """Groups the number of each tile by the unique tile values.
+
+  Returns:
+    A dict of point value to a dict of letter to number of tiles.
+  """
+  tiles = collections.defaultdict(dict)
+  for letter, points in POINTS.items():
+    tiles[points][letter] = TILES[letter]
+  return dict(tiles)
+
+
+@functools.lru_cache(maxsize=None)
+def _point_combinations(points, r):
+  """Counts the distinct ways to choose r tiles with a point value."""
+  return int(distinct_combinations(tiles_with_points()[points], r))
+
+
 def value_hands_slow(value, hand_size=7):
   """Calculates the number of Scrabble hands with a given value.
 
@@ -151,16 +168,12 @@ def value_hands_fast(value, hand_size=7):
   Returns:
     The number of unique Scrabble hands that have this value.
   """
-  # Group the number of each tile by the unique tile values.
-  tiles_with_points = collections.defaultdict(dict)
-  for letter, points in POINTS.items():
-    tiles_with_points[points][letter] = TILES[letter]
-
+  tiles = tiles_with_points()
   count = 0
   # Try each possible hand-sized set of point values. This ignores limits on
   # number of tiles of each point value, so some of these combinations will be
   # invalid if they contain more of a value than is available in a Scrabble set.
-  for points in itertools.combinations_with_replacement(tiles_with_points.keys(),
+  for points in itertools.combinations_with_replacement(tiles.keys(),
                                                         hand_size):
     # First check if the value of the hand matches our target value.
     if sum(points) != value:
@@ -170,29 +183,46 @@ def value_hands_fast(value, hand_size=7):
     for p, c in points.items():
       # Check that the hand doesn't contain more tiles with point value than
       # there are tiles with that value (of any letter) in a Scrabble set.
-      if c > sum(tiles_with_points[p].values()):
+      if c > sum(tiles[p].values()):
         break
     else:
       # The number of hands with this set of point values is a the product of
       # the number of distinct combinations of required number of the tiles
       # with each point value.
       count += functools.reduce(operator.mul,
-                                (distinct_combinations(tiles_with_points[p], c)
+                                (_point_combinations(p, c)
                                  for p, c in points.items()),
                                  1)
   return count
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('-s', '--hand-size', type=int, default=7,
                       help='Hand size')
   parser.add_argument('value', type=int, nargs='?', default=46,
                       help='Hand point value')
-  args = parser.parse_args()
-
-  try:
-    num_hands = value_hands_fast(args.value, hand_size=args.hand_size)
-  except:
-    num_hands = value_hands_slow(args.value, hand_size=args.hand_size)
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
+
+  def compute():
+    try:
+      return int(value_hands_fast(args.value, hand_size=args.hand_size))
+    except:
+      return value_hands_slow(args.value, hand_size=args.hand_size)
+
+  num_hands = resultcache.cached(
+      'mpmp3', __file__, {'value': args.value, 'hand_size': args.hand_size},
+      compute, enabled=not args.no_cache)
   print(num_hands)
+
+
+if __name__ == '__main__':
+  main()
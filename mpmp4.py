@@ -11,6 +11,15 @@ starting position.
 """
 
 import argparse
+import array
+import heapq
+import sys
+
+import resultcache
+
+
+# Number of table rows to format before each write in write_states().
+CHUNK_SIZE = 4096
 
 
 def cards_to_state(flipped):
@@ -35,12 +44,12 @@ def state_to_cards(state):
     A list of cards that have been flipped (numbered starting at 1).
   """
   flipped = []
-  card = 1
   while state:
-    if state & 1:
-      flipped.append(card)
-    card += 1
-    state >>= 1
+    # Isolate the lowest set bit so we only loop once per flipped card rather
+    # than once per card.
+    low = state & -state
+    flipped.append(low.bit_length())
+    state ^= low
   return flipped
 
 
@@ -64,23 +73,101 @@ def do_flips(flips, start_state=0):
     yield state
 
 
-def print_state(state, cards=4, flipped=''):
-  """Prints a state of the cards.
+def format_state(state, cards=4, flipped=''):
+  """Formats a state of the cards as a row of the flip table.
 
   Args:
     state: The card state bitfield (or a list of flipped cards).
     cards: The total number of cards.
     flipped: The card flipped to make this state.
+  Returns:
+    The tab-separated row (without a trailing newline).
   """
   if isinstance(state, (list, tuple)):
     state = cards_to_state(state)
-  print('{}\t{}\t{:0{}b}\t{}'.format(flipped,
-                                     ''.join(map(str, state_to_cards(state))),
-                                     state, cards,
-                                      state))
+  return '{}\t{}\t{:0{}b}\t{}'.format(flipped,
+                                      ''.join(map(str, state_to_cards(state))),
+                                      state, cards,
+                                      state)
+
+
+def print_state(state, cards=4, flipped=''):
+  """Prints a state of the cards.
+
+  Args:
+    state: The card state bitfield (or a list of flipped cards).
+    cards: The total number of cards.
+    flipped: The card flipped to make this state.
+  """
+  print(format_state(state, cards, flipped))
+
 
+def write_states(states, flips, cards=4, file=None, chunk_size=CHUNK_SIZE):
+  """Writes the flip table for a sequence of states.
+
+  Rather than printing one line at a time, rows are formatted in chunks and
+  each chunk is written with a single call, which is much faster for large
+  numbers of cards.
+
+  Args:
+    states: The card state bitfields, starting with the initial state.
+    flips: The card flipped to make each state after the initial state.
+    cards: The total number of cards.
+    file: The file to write to (defaults to stdout).
+    chunk_size: The number of rows to format per write.
+  """
+  if file is None:
+    file = sys.stdout
+  fmt = '{}\t{}\t{:0%db}\t{}\n' % cards
+  # Cache the flipped card strings for the low and high halves of the state so
+  # each row only needs two lookups instead of a loop over the bits.
+  low_bits = cards // 2
+  low_mask = (1 << low_bits) - 1
+  low_cards = [''.join(map(str, state_to_cards(state)))
+               for state in range(1 << low_bits)]
+  high_cards = [''.join(map(str, state_to_cards(state << low_bits)))
+                for state in range(1 << (cards - low_bits))]
+  rows = []
+  for flipped, state in zip([''] + list(flips), states):
+    rows.append(fmt.format(flipped,
+                           low_cards[state & low_mask] +
+                               high_cards[state >> low_bits],
+                           state, state))
+    if len(rows) >= chunk_size:
+      file.write(''.join(rows))
+      rows = []
+  if rows:
+    file.write(''.join(rows))
 
-def test_flips(flips, cards=4, up_or_down=False):
+
+def save_states(states, path, cards=4):
+  """Saves a sequence of states in a compact binary form.
+
+  If the path ends in ``.npy`` the states are saved as a NumPy array (which
+  can be loaded with ``numpy.load(path, mmap_mode='r')``), otherwise they are
+  written as raw native-endian unsigned integers of the smallest size that
+  fits the number of cards.
+
+  Args:
+    states: The card state bitfields.
+    path: The file to write to.
+    cards: The total number of cards.
+  """
+  for typecode in 'BHIQ':
+    if array.array(typecode).itemsize * 8 >= cards:
+      break
+  else:
+    raise ValueError('Too many cards to save: {}'.format(cards))
+  states = array.array(typecode, states)
+  if path.endswith('.npy'):
+    import numpy as np
+    np.save(path, np.frombuffer(states, dtype=typecode))
+  else:
+    with open(path, 'wb') as f:
+      states.tofile(f)
+
+
+def test_flips(flips, cards=4, up_or_down=False, summary=False, dump=None):
   """Tests whether a series of card flips is guaranteed to win.
 
   Args:
@@ -88,6 +175,12 @@ def test_flips(flips, cards=4, up_or_down=False):
     cards: The total number of cards.
     up_or_down: If True, you win if it flips them either all up or down,
         if False, they must flip all up.
+    summary: If True, only print the number of flips and the result instead
+        of the whole flip table.
+    dump: If not None, a path to save the sequence of states to (see
+        save_states()).
+  Returns:
+    True if the flips are guaranteed to win.
   """
   # Starting with the initial state, all states must be tried.
   all_states = frozenset(range(1 << cards))
@@ -95,10 +188,15 @@ def test_flips(flips, cards=4, up_or_down=False):
   flips = list(flips)
   states = list(do_flips(flips))
 
-  print('Flip\tFlipped\tBits\tDecimal')
-  print('----\t-------\t----\t-------')
-  for flipped, state in zip([''] + flips, states):
-    print_state(state, cards, flipped)
+  if dump is not None:
+    save_states(states, dump, cards)
+
+  if summary:
+    print('{} flips'.format(len(flips)))
+  else:
+    print('Flip\tFlipped\tBits\tDecimal')
+    print('----\t-------\t----\t-------')
+    write_states(states, flips, cards)
 
   states = set(states)
   if up_or_down:
@@ -109,8 +207,10 @@ def test_flips(flips, cards=4, up_or_down=False):
     states |= set(state ^ ((1 << cards) - 1) for state in states)
   if states == all_states:
     print('Success')
+    return True
   else:
     print('Failure')
+    return False
 
 
 
@@ -129,14 +229,286 @@ def graycode(digits):
   yield from graycode(digits - 1)
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+def _popcount(bits):
+  return bin(bits).count('1')
+
+
+def _xor_permutation(cards):
+  """Builds a function to XOR every state in a belief by a flip mask.
+
+  A belief is a set of card states packed as a bitset (bit s is set if state s
+  is possible). XORing every state by a single card's bit swaps adjacent blocks
+  of the bitset, so a whole belief can be updated with a few big-integer
+  operations instead of a loop over its states.
+
+  Args:
+    cards: The total number of cards.
+  Returns:
+    A function taking (belief, mask) that returns the belief with every state
+    XORed by the mask.
+  """
+  num_states = 1 << cards
+  all_bits = (1 << num_states) - 1
+  # For each card, the bitset of states where that card is not flipped.
+  patterns = []
+  for card in range(cards):
+    block = 1 << card
+    patterns.append(all_bits // ((1 << (2 * block)) - 1) *
+                    ((1 << block) - 1))
+
+  def permute(belief, mask):
+    for card, pattern in enumerate(patterns):
+      if mask & (1 << card):
+        block = 1 << card
+        belief = ((belief & pattern) << block) | ((belief >> block) & pattern)
+    return belief
+
+  return permute
+
+
+class _DominanceIndex:
+  """The beliefs expanded so far, indexed for finding dominating beliefs.
+
+  A belief is dominated if a subset of it was reached in as few moves: any
+  sequence of moves that wins from a belief also wins from every subset of
+  it, so the superset can never lead to a shorter solution.
+
+  This is an inverted index. For each depth, beliefs are numbered in blocks
+  and each block keeps, for each state, a bitset of the beliefs in it that
+  contain that state. The beliefs that aren't subsets of a belief are the
+  union of the bitsets for the states it doesn't contain, so a check is a few
+  big-integer ORs per block rather than a comparison per belief.
+  """
+
+  BLOCK_SIZE = 1 << 12
+
+  def __init__(self, states):
+    """
+    Args:
+      states: A bitset of the states that can be in a belief.
+    """
+    self._states = states
+    # depth -> list of [count, {state: bitset of beliefs}]
+    self._blocks = {}
+
+  def dominated(self, belief, depth):
+    """Checks if a subset of a belief was expanded in at most depth moves."""
+    missing = list(_states(self._states & ~belief))
+    for other_depth, blocks in self._blocks.items():
+      if other_depth > depth:
+        continue
+      for count, containing in blocks:
+        full = (1 << count) - 1
+        excluded = 0
+        for state in missing:
+          excluded |= containing.get(state, 0)
+          if excluded == full:
+            break
+        else:
+          return True
+    return False
+
+  def add(self, belief, depth):
+    blocks = self._blocks.setdefault(depth, [])
+    if not blocks or blocks[-1][0] == self.BLOCK_SIZE:
+      blocks.append([0, {}])
+    block = blocks[-1]
+    bit = 1 << block[0]
+    containing = block[1]
+    for state in _states(belief):
+      containing[state] = containing.get(state, 0) | bit
+    block[0] += 1
+
+
+def _states(belief):
+  """Yields the states in a belief."""
+  while belief:
+    low = belief & -belief
+    yield low.bit_length() - 1
+    belief ^= low
+
+
+def _span(masks):
+  """Gets a basis of the XOR span of some masks (highest bit first)."""
+  basis = []
+  for mask in masks:
+    for b in basis:
+      mask = min(mask, mask ^ b)
+    if mask:
+      basis.append(mask)
+      basis.sort(reverse=True)
+  return basis
+
+
+def _reduce(x, basis):
+  for b in basis:
+    x = min(x, x ^ b)
+  return x
+
+
+# The default number of beliefs solve_flips() expands before giving up.
+MAX_NODES = 100_000
+
+
+def solve_flips(cards=4, moves=None, winning=(0,), start_states=None,
+                prune=True, max_nodes=MAX_NODES):
+  """Finds an optimal sequence of moves that is guaranteed to win.
+
+  This searches over belief states, the set of states the cards could be in
+  given that we haven't won yet, so a sequence of moves that empties the
+  belief is a guaranteed win.
+
+  The search is A*: each move can only rule out as many states as there are
+  winning states, so a belief needs at least its size divided by that many
+  more moves. Beliefs are expanded in order of moves so far plus that bound
+  (deepest first on ties), so the first empty belief found has the fewest
+  moves. Start states that can't reach a winning state with any combination
+  of the moves are detected up front.
+
+  With one winning state and moves that can reach every state (like the
+  default single card moves) the bound is exact, so the search goes almost
+  straight to a solution: 8 cards (255 moves) takes a fraction of a second.
+  Otherwise the bound can be loose and the search may need far more beliefs
+  than is practical, even for 5 cards. Expanding a belief takes roughly
+  0.1-0.3ms, so the default max_nodes gives up after about 10-30 seconds.
+
+  Args:
+    cards: The total number of cards.
+    moves: A list of allowed moves, each a list of cards to flip at once
+        (numbered starting at 1). Defaults to flipping any single card.
+    winning: The winning states, each a card state bitfield (or a list of
+        flipped cards). You win as soon as the cards are in any of these.
+    start_states: The possible starting states (bitfields or lists of flipped
+        cards). Defaults to every state.
+    prune: If True, beliefs that are a superset of a belief already expanded
+        in as few moves are dropped.
+    max_nodes: The number of beliefs to expand before giving up, or None for
+        no limit.
+  Returns:
+    A list of moves (each a list of cards to flip) or None if no sequence of
+    moves is guaranteed to win.
+  Raises:
+    RuntimeError: If max_nodes beliefs were expanded without finishing.
+  """
+  if moves is None:
+    moves = [[card] for card in range(1, cards + 1)]
+  moves = [list(move) for move in moves]
+  masks = [cards_to_state(move) for move in moves]
+  if start_states is None:
+    start_states = range(1 << cards)
+
+  def to_bits(states):
+    bits = 0
+    for state in states:
+      if isinstance(state, (list, tuple)):
+        state = cards_to_state(state)
+      bits |= 1 << state
+    return bits
+
+  winning_bits = to_bits(winning)
+  not_winning = ~winning_bits
+  # The most states a single move can rule out.
+  per_move = max(_popcount(winning_bits), 1)
+  permute = _xor_permutation(cards)
+
+  def bound(belief):
+    return -(-_popcount(belief) // per_move)
+
+  start = to_bits(start_states) & not_winning
+  # A state can only ever be XORed with the span of the moves, so if any
+  # start can't reach a winning state that way no sequence of moves wins.
+  basis = _span(masks)
+  targets = {_reduce(state, basis) for state in _states(winning_bits)}
+  if any(_reduce(state, basis) not in targets for state in _states(start)):
+    return None
+  # Maps each belief seen to the belief and move index that reached it, and
+  # the fewest moves it has been reached in.
+  parents = {start: None}
+  depths = {start: 0}
+  index = _DominanceIndex(((1 << (1 << cards)) - 1) & not_winning)
+  # (moves + bound, -moves, tie breaker, belief)
+  queue = [(bound(start), 0, 0, start)]
+  pushed = 1
+  expanded = 0
+  while queue:
+    _, depth, _, belief = heapq.heappop(queue)
+    depth = -depth
+    if depth > depths[belief]:
+      # Already reached in fewer moves.
+      continue
+    if not belief:
+      solution = []
+      while parents[belief] is not None:
+        belief, i = parents[belief]
+        solution.append(moves[i])
+      solution.reverse()
+      return solution
+    if prune:
+      if index.dominated(belief, depth):
+        continue
+      index.add(belief, depth)
+    expanded += 1
+    if max_nodes is not None and expanded > max_nodes:
+      raise RuntimeError('Gave up after expanding {:,} beliefs'.format(
+          max_nodes))
+    for i, mask in enumerate(masks):
+      new_belief = permute(belief, mask) & not_winning
+      if depth + 1 < depths.get(new_belief, depth + 2):
+        parents[new_belief] = (belief, i)
+        depths[new_belief] = depth + 1
+        heapq.heappush(queue, (depth + 1 + bound(new_belief), -(depth + 1),
+                               pushed, new_belief))
+        pushed += 1
+  return None
+
+
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('--up-or-down', action='store_true',
                       help='Face up or down')
+  parser.add_argument('-q', '--summary', action='store_true',
+                      help='Only print the result, not the flip table')
+  parser.add_argument('-d', '--dump',
+                      help='Save the states to a binary (or .npy) file')
+  parser.add_argument('-s', '--solve', action='store_true',
+                      help='Search for an optimal set of flips instead of '
+                           'using graycode')
   parser.add_argument('cards', type=int, nargs='?', default=4,
                       help='Number of cards')
-  args = parser.parse_args()
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
 
-  test_flips(graycode(args.cards - args.up_or_down),
+  if args.solve:
+    winning = [0]
+    if args.up_or_down:
+      winning.append((1 << args.cards) - 1)
+    try:
+      solution = resultcache.cached(
+          'mpmp4', __file__, {'cards': args.cards, 'winning': winning},
+          lambda: solve_flips(args.cards, winning=winning),
+          enabled=not args.no_cache)
+    except RuntimeError as e:
+      print(e)
+      return
+    if solution is None:
+      print('No solution')
+      return
+    flips = [card for move in solution for card in move]
+  else:
+    flips = graycode(args.cards - args.up_or_down)
+  test_flips(flips,
              cards=args.cards,
-             up_or_down=args.up_or_down)
+             up_or_down=args.up_or_down,
+             summary=args.summary,
+             dump=args.dump)
+
+
+if __name__ == '__main__':
+  main()
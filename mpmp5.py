@@ -9,6 +9,11 @@ What is the minimum number of moves needed to leave just one coin remaining?
 """
 
 import argparse
+import functools
+import os
+
+import resultcache
+import searchstats
 
 
 def coord_to_index(coord):
@@ -91,6 +96,13 @@ class Triangle:
     y, x = index_to_coord(index)
     self.rows[y][x] = value
 
+  @property
+  def bits(self):
+    """Gets the board as a bitfield where bit i is set if index i+1 is full."""
+    return sum(full << i
+               for i, full in enumerate(full for row in self.rows
+                                        for full in row))
+
   def move(self, src, *dests):
     """Moves a coin.
 
@@ -183,6 +195,39 @@ class Triangle:
           new_tri = Triangle(self, src, dest)
           yield new_tri
 
+  def get_macro_moves(self, ignore_symmetry=True, stats=None):
+    """Iterates all valid moves, where a move is a whole chain of jumps.
+
+    Each move is one coin jumping one or more times, like the puzzle counts
+    moves, and only one move is yielded for each board it leads to. Chains
+    starting with the coin that made the last move are skipped, since they
+    were already yielded as longer chains of the last move.
+
+    Args:
+      ignore_symmetry: If True, only unique initial moves will be tried
+          ignoring symmetric locations (only cells along first half of the
+          the top-left edge of each nested triangle).
+      stats: An optional searchstats.SearchStats to count repeated boards in.
+    Yields:
+      A new Triangle board state for each possible move.
+    """
+    if not self.moves:
+      yield from self.get_moves(ignore_symmetry=ignore_symmetry)
+      return
+    last = self.moves[-1][-1] if len(self.moves) > 1 else None
+    jumps = jump_table(len(self.rows))
+    bits = self.bits
+    seen = set()
+    visited = set()
+    for src in range(1, len(self)):
+      if src != last and self[src]:
+        for dests, new_bits in _chains(bits, src - 1, jumps, visited):
+          if new_bits not in seen:
+            seen.add(new_bits)
+            yield Triangle(self, src, *(dest + 1 for dest in dests))
+          elif stats is not None:
+            stats.hit('repeated board')
+
   def draw(self):
     """Gets an ASCII drawing of the current board as a string."""
     return '\n'.join(' ' * (len(self.rows) - y - 1) +
@@ -193,41 +238,335 @@ class Triangle:
   def solved(self):
     return sum(full for row in self.rows for full in row) == 1
 
-  def solve(self, ignore_symmetry=True):
+  def solve(self, ignore_symmetry=True, macro=False, stats=None):
     """Find all possible moves that result in a solved board (1 coin left).
 
     Args:
       ignore_symmetry: If True, only unique initial moves will be tried
           ignoring symmetric locations (only cells along first half of the
           the top-left edge of each nested triangle).
+      macro: If True, expand whole chains of jumps as moves (see
+          get_macro_moves()), so there's one solution per sequence of boards
+          instead of one per sequence of jumps.
+      stats: An optional searchstats.SearchStats to record the search in.
     Returns:
       A list of move lists that result in a solved board. Sorted from shortest
       solution to longest.
     """
+    if stats is not None:
+      return self._solve_with_stats(ignore_symmetry, macro, stats)
     solutions = []
     states = [self]
     while states:
       state = states.pop()
       if state.solved:
         solutions.append(state.moves)
+      elif macro:
+        states.extend(state.get_macro_moves(ignore_symmetry=ignore_symmetry))
       else:
         states.extend(state.get_moves(ignore_symmetry=ignore_symmetry))
     solutions.sort(key=len)
     return solutions
 
+  def _solve_with_stats(self, ignore_symmetry, macro, stats):
+    """Same as solve(), but recording each node in stats."""
+    solutions = []
+    # Each state is kept with its depth and share of the search tree.
+    states = [(self, 0, 1.0)]
+    while states:
+      state, depth, weight = states.pop()
+      if state.solved:
+        stats.finish(weight)
+        solutions.append(state.moves)
+        continue
+      if macro:
+        new_states = list(state.get_macro_moves(
+            ignore_symmetry=ignore_symmetry, stats=stats))
+      else:
+        new_states = list(state.get_moves(ignore_symmetry=ignore_symmetry))
+      weight = stats.expand(depth, len(new_states), weight)
+      states.extend((new_state, depth + 1, weight) for new_state in new_states)
+    solutions.sort(key=len)
+    return solutions
+
+  def shortest_solution(self, ignore_symmetry=True, stats=None):
+    """Find a solution with the fewest moves.
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+    This is a breadth-first search over whole chains of jumps, so the first
+    solved board found has the fewest moves, and each board is only expanded
+    once.
+
+    Args:
+      ignore_symmetry: If True, only unique initial moves will be tried
+          ignoring symmetric locations (only cells along first half of the
+          the top-left edge of each nested triangle).
+      stats: An optional searchstats.SearchStats to record the search in.
+    Returns:
+      A move list or None if there aren't any solutions.
+    """
+    seen = {self.bits}
+    states = [self]
+    depth = 0
+    while states:
+      new_states = []
+      for state in states:
+        if state.solved:
+          return state.moves
+        children = 0
+        for new_state in state.get_macro_moves(ignore_symmetry=ignore_symmetry,
+                                               stats=stats):
+          bits = new_state.bits
+          if bits not in seen:
+            seen.add(bits)
+            new_states.append(new_state)
+            children += 1
+          elif stats is not None:
+            stats.hit('seen board')
+        if stats is not None:
+          # A breadth-first search doesn't finish subtrees, so there's no ETA.
+          stats.expand(depth, children, 0.0)
+      states = new_states
+      depth += 1
+    return None
+
+
+@functools.lru_cache()
+def jump_table(rows):
+  """Gets all the possible jumps on an empty board.
+
+  Args:
+    rows: The number of rows.
+  Returns:
+    A list where item i is a tuple of (jumped, dest) bit numbers for the
+    jumps from bit i (index i+1) that stay on the board.
+  """
+  board = Triangle(rows)
+  table = []
+  for src in range(1, len(board)):
+    y, x = index_to_coord(src)
+    jumps = []
+    # With a full board, _moves_from() wouldn't find any empty place to land,
+    # so check the same directions here without the board contents.
+    for dest in [(y - 2, x), (y + 2, x), (y, x - 2), (y, x + 2),
+                 (y - 2, x - 2), (y + 2, x + 2)]:
+      if 0 <= dest[0] < rows and 0 <= dest[1] < dest[0] + 1:
+        jumped = ((y + dest[0]) // 2, (x + dest[1]) // 2)
+        jumps.append((coord_to_index(jumped) - 1, coord_to_index(dest) - 1))
+    table.append(tuple(jumps))
+  return table
+
+
+def _jumps(bits, jumps):
+  """Iterates the single jumps from a board bitfield.
+
+  Args:
+    bits: The board bitfield.
+    jumps: The jump_table() for the board size.
+  Yields:
+    (dest, new_bits) for each jump.
+  """
+  src = 0
+  remaining = bits
+  while remaining:
+    if remaining & 1:
+      for jumped, dest in jumps[src]:
+        if bits >> jumped & 1 and not bits >> dest & 1:
+          yield dest, bits ^ (1 << src) ^ (1 << jumped) ^ (1 << dest)
+    remaining >>= 1
+    src += 1
+
+
+def _chains(bits, src, jumps, visited=None, dests=()):
+  """Iterates the boards reachable by jumping the coin at src one or more
+  times.
+
+  Args:
+    bits: The board bitfield.
+    src: The bit number of the coin to jump.
+    jumps: The jump_table() for the board size.
+    visited: An optional set of (board bitfield, bit number) that have already
+        been jumped from, to skip repeating them. This is updated.
+    dests: The bit numbers already jumped to in this chain.
+  Yields:
+    (dests, new_bits) with the bit numbers jumped to and the board bitfield
+    after each chain of jumps (possibly repeating boards).
+  """
+  for jumped, dest in jumps[src]:
+    if bits >> jumped & 1 and not bits >> dest & 1:
+      new_bits = bits ^ (1 << src) ^ (1 << jumped) ^ (1 << dest)
+      new_dests = dests + (dest,)
+      yield new_dests, new_bits
+      if visited is not None:
+        if (new_bits, dest) in visited:
+          continue
+        visited.add((new_bits, dest))
+      yield from _chains(new_bits, dest, jumps, visited, new_dests)
+
+
+UNSOLVABLE = 255
+
+TABLE_DTYPE = [('moves', 'u1'), ('solutions', 'u8')]
+
+
+def retrograde_table(rows):
+  """Solves every position reachable from a board with one coin removed.
+
+  Positions are found level by level going forward (every jump removes one
+  coin) and then solved going backward from the single coin positions, so
+  each position is only solved once.
+
+  Args:
+    rows: The number of rows.
+  Returns:
+    A NumPy structured array indexed by board bitfield (see Triangle.bits)
+    with the minimum number of moves to leave one coin ("moves", where a
+    chain of jumps by one coin is one move, or UNSOLVABLE) and the number of
+    sequences of jumps that leave one coin ("solutions"). Positions that
+    aren't reachable are UNSOLVABLE with no solutions.
+  """
+  jumps = jump_table(rows)
+  cells = len(jumps)
+  full = (1 << cells) - 1
+  levels = [{full ^ (1 << hole) for hole in range(cells)}]
+  while len(levels) < cells - 1:
+    levels.append({new_bits for bits in levels[-1]
+                   for _, new_bits in _jumps(bits, jumps)})
+
+  # Solve into dicts (much faster than indexing NumPy arrays one item at a
+  # time) and then copy into the table.
+  moves = dict.fromkeys(levels.pop(), 0)
+  solutions = dict.fromkeys(moves, 1)
+  for level in reversed(levels):
+    for bits in level:
+      count = sum(solutions[new_bits] for _, new_bits in _jumps(bits, jumps))
+      solutions[bits] = count
+      if count:
+        best = UNSOLVABLE
+        remaining, src = bits, 0
+        while remaining:
+          if remaining & 1:
+            for _, new_bits in _chains(bits, src, jumps):
+              best = min(best, moves.get(new_bits, UNSOLVABLE) + 1)
+          remaining >>= 1
+          src += 1
+        moves[bits] = best
+
+  import numpy as np
+  table = np.zeros(1 << cells, dtype=TABLE_DTYPE)
+  table['moves'] = UNSOLVABLE
+  index = np.fromiter(moves, dtype=np.int64, count=len(moves))
+  table['moves'][index] = np.fromiter(moves.values(), dtype=np.uint8,
+                                      count=len(moves))
+  index = np.fromiter(solutions, dtype=np.int64, count=len(solutions))
+  table['solutions'][index] = np.fromiter(solutions.values(), dtype=np.uint64,
+                                          count=len(solutions))
+  return table
+
+
+def load_table(rows, path=None, cache=True):
+  """Loads a retrograde_table(), building and saving it first if needed.
+
+  Args:
+    rows: The number of rows.
+    path: The .npy file to use (.npy is added if it's missing), or None to
+        store it in the result cache. A file is only rebuilt if it's
+        missing, so delete it after changing the code.
+    cache: If False and path is None, just build the table in memory.
+  Returns:
+    The table, memory-mapped from the file (if it could be saved).
+  """
+  import numpy as np
+  if path is None:
+    return resultcache.cached('mpmp5', __file__, {'table': rows},
+                              lambda: retrograde_table(rows), kind='npy',
+                              enabled=cache, mmap=True)
+  if not path.endswith('.npy'):
+    # np.save() would add it anyway.
+    path += '.npy'
+  if not os.path.exists(path):
+    import tempfile
+    # Write to a temporary file and rename it into place so other processes
+    # never load a partial table.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                     suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        np.save(f, retrograde_table(rows))
+      os.replace(temp_path, path)
+    except BaseException:
+      os.unlink(temp_path)
+      raise
+  return np.load(path, mmap_mode='r')
+
+
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('-i', '--ignore-symmetry', action='store_true',
                       help='Skip symmetric starting locations')
   parser.add_argument('-s', '--start', type=int,
                       help='Starting location')
+  parser.add_argument('-m', '--macro', action='store_true',
+                      help='Only find one solution per sequence of boards')
+  parser.add_argument('--shortest', action='store_true',
+                      help='Only find one solution with the fewest moves')
+  parser.add_argument('--stats', action='store_true',
+                      help='Print search progress and statistics to stderr')
+  parser.add_argument('--profile', metavar='FILE',
+                      help='Profile the search and write the stats to FILE')
+  parser.add_argument('-t', '--table', action='store_true',
+                      help='Look up the minimum moves and number of solutions '
+                           'in a precomputed table (built and cached if '
+                           'needed)')
+  parser.add_argument('--table-file', metavar='PATH',
+                      help='Like --table, but keep the table in this .npy '
+                           'file instead of the cache')
   parser.add_argument('rows', type=int, nargs='?', default=4,
                       help='Number of rows')
-  args = parser.parse_args()
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
+
+  if args.table or args.table_file:
+    table = load_table(args.rows, args.table_file, cache=not args.no_cache)
+    tri = Triangle(args.rows)
+    for start in [args.start] if args.start else range(1, len(tri)):
+      entry = table[Triangle(tri, start).bits]
+      if entry['moves'] == UNSOLVABLE:
+        print('{}: No solutions'.format(start))
+      else:
+        # Count removing the first coin as a move like solve() does.
+        print('{}: {} moves, {} solutions'.format(start, entry['moves'] + 1,
+                                                  entry['solutions']))
+    return
 
   tri = Triangle(args.rows, src=args.start)
-  solutions = tri.solve(ignore_symmetry=args.ignore_symmetry)
+  stats = searchstats.SearchStats() if args.stats else None
+
+  def compute():
+    if args.shortest:
+      solution = tri.shortest_solution(ignore_symmetry=args.ignore_symmetry,
+                                       stats=stats)
+      return [solution] if solution else []
+    return tri.solve(ignore_symmetry=args.ignore_symmetry, macro=args.macro,
+                     stats=stats)
+
+  with searchstats.profiled(args.profile):
+    # Statistics and profiles are only useful if the search actually runs.
+    solutions = resultcache.cached(
+        'mpmp5', __file__,
+        {'rows': args.rows, 'start': args.start,
+         'ignore_symmetry': args.ignore_symmetry, 'macro': args.macro,
+         'shortest': args.shortest},
+        compute, kind='jsonl',
+        enabled=not (args.no_cache or args.stats or args.profile))
+  if stats is not None:
+    stats.print_summary()
   if solutions:
     for moves in solutions:
       print('{} moves: {}'.format(
@@ -235,3 +574,7 @@ if __name__ == '__main__':
           ', '.join('-'.join(map(str, move)) for move in moves)))
   else:
     print('No solutions')
+
+
+if __name__ == '__main__':
+  main()
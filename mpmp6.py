@@ -27,9 +27,22 @@ balance(n) = fib(n) * a + fib(n - 1) * b
 """
 
 import argparse
+import bisect
+import collections
+import fractions
 import functools
 import itertools
+import json
+import math
+import re
+import sys
 
+import resultcache
+
+
+# Fibonacci numbers below this index are kept in a list that is extended
+# sequentially. Larger ones are calculated by fast doubling.
+FIB_CACHE_SIZE = 1024
 
 _fib_cache = [0, 1]
 def fib(n):
@@ -37,9 +50,31 @@ def fib(n):
 
   Where fib(0) == 0 and fib(1) == 1.
   """
-  while n >= len(_fib_cache):
-    _fib_cache.append(_fib_cache[-2] + _fib_cache[-1])
-  return _fib_cache[n]
+  if n < FIB_CACHE_SIZE:
+    while n >= len(_fib_cache):
+      _fib_cache.append(_fib_cache[-2] + _fib_cache[-1])
+    return _fib_cache[n]
+  return _fib_pair(n)[0]
+
+
+@functools.lru_cache(maxsize=256)
+def _fib_pair(n):
+  """Gets (fib(n), fib(n + 1)) using fast doubling.
+
+  Uses the identities:
+    fib(2k) == fib(k) * (2 * fib(k + 1) - fib(k))
+    fib(2k + 1) == fib(k) ** 2 + fib(k + 1) ** 2
+  so this only takes O(log n) multiplications. Recent results are kept in a
+  bounded LRU cache.
+  """
+  if n < FIB_CACHE_SIZE - 1:
+    return (fib(n), fib(n + 1))
+  a, b = _fib_pair(n // 2)
+  c = a * (2 * b - a)
+  d = a * a + b * b
+  if n % 2:
+    return (d, c + d)
+  return (c, d)
 
 
 def balance(a, b, n):
@@ -55,6 +90,56 @@ def balance(a, b, n):
   return fib(n) * a + fib(n - 1) * b
 
 
+def egcd(a, b):
+  """Extended Euclidean algorithm.
+
+  Returns:
+    (g, x, y) where g is the greatest common divisor of a and b and
+    a * x + b * y == g.
+  """
+  x0, y0, x1, y1 = 1, 0, 0, 1
+  while b:
+    q, r = divmod(a, b)
+    a, b = b, r
+    x0, x1 = x1, x0 - q * x1
+    y0, y1 = y1, y0 - q * y1
+  return a, x0, y0
+
+
+def mod_inverse(a, m):
+  """Gets the modular multiplicative inverse of a modulo m.
+
+  Raises:
+    ValueError: If a and m aren't coprime.
+  """
+  g, x, _ = egcd(a % m, m)
+  if g != 1:
+    raise ValueError('{} has no inverse modulo {}'.format(a, m))
+  return x % m
+
+
+def fib_inverse(n, f=None, g=None):
+  """Gets the inverse of fib(n - 1) modulo fib(n).
+
+  By Cassini's identity, fib(n - 1) ** 2 - fib(n) * fib(n - 2) == (-1) ** n,
+  so fib(n - 1) is its own inverse (up to sign). This avoids running the
+  extended Euclidean algorithm on consecutive Fibonacci numbers, which is its
+  worst case (n steps).
+
+  Args:
+    n: The day number.
+    f: fib(n), if already known.
+    g: fib(n - 1), if already known.
+  """
+  if f is None:
+    f = fib(n)
+  if g is None:
+    g = fib(n - 1)
+  if n % 2:
+    return -g % f
+  return g % f
+
+
 def find_deposits(total):
   """Find the minimum deposit amounts to eventually reach a certain balance.
 
@@ -64,32 +149,1018 @@ def find_deposits(total):
     (a, b, n) where a and b are the day 1 and day 2 deposits (respectively)
     and n is the number of days it will take to reach the total.
   """
-  max_n = 0
-  while fib(max_n) <= total:
-    max_n += 1
-  # If fib(x) > total, then fib(x - 1) + fib(x - 2) > total
-  # so even if a and b are both 1, then on day x - 1 the balance would be too
-  # high so the maximum day would be x - 2.
-  max_n -= 2
-
-  for n in range(max_n, 0, -1):
-    for b in itertools.count(1):
-      a = (total - fib(n - 1) * b) / fib(n)
-      if int(a) == a:
-        return (int(a), b, n)
-      elif a < 1:
-        break
+  # Even if a and b are both 1, the balance on day n is fib(n) + fib(n - 1),
+  # which is fib(n + 1), so the maximum day is the last one where
+  # fib(n + 1) <= total. Walk the Fibonacci numbers up to that day and back
+  # down again so we don't need to cache them.
+  n, f, g = 1, 1, 0  # f == fib(n), g == fib(n - 1)
+  while f + f + g <= total:
+    n, f, g = n + 1, f + g, f
+
+  for n in range(n, 0, -1):
+    if f + g <= total:
+      # We need fib(n) * a == total - fib(n - 1) * b, so fib(n - 1) * b must
+      # be congruent to the total modulo fib(n). Consecutive Fibonacci
+      # numbers are coprime, so there's exactly one such b modulo fib(n) and
+      # the smallest positive one is the best we can do for this n.
+      b = total * fib_inverse(n, f, g) % f or f
+      a, remainder = divmod(total - g * b, f)
+      assert remainder == 0
+      if a >= 1:
+        return (a, b, n)
+    f, g = g, f - g
   raise ValueError('Not possible')
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+DepositFamily = collections.namedtuple('DepositFamily',
+                                       'n a b a_step b_step count')
+DepositFamily.__doc__ = """All the deposits that reach a total on day n.
+
+The solutions are (a + k * a_step, b + k * b_step) for k in range(count),
+where (a, b) is the solution with the smallest b.
+"""
+
+
+def deposit_families(total):
+  """Finds every pair of deposits that reaches a total, grouped by day.
+
+  For a fixed day n, if fib(n) * a + fib(n - 1) * b == total, then adding
+  fib(n) to b and subtracting fib(n - 1) from a keeps the same total, and
+  since consecutive Fibonacci numbers are coprime, every solution is found
+  this way from the one with the smallest b. So the solutions for each day
+  are an arithmetic progression that is only bounded by a and b being
+  positive.
+
+  Day 1 is skipped since the balance is just a, so any b would work.
+
+  Args:
+    total: The target balance to eventually reach.
+  Yields:
+    A DepositFamily for each day that has solutions, from the latest day to
+    the earliest.
+  """
+  n, f, g = 1, 1, 0  # f == fib(n), g == fib(n - 1)
+  while f + f + g <= total:
+    n, f, g = n + 1, f + g, f
+
+  for n in range(n, 1, -1):
+    b = total * fib_inverse(n, f, g) % f or f
+    max_b = (total - f) // g
+    if b <= max_b:
+      a = (total - g * b) // f
+      yield DepositFamily(n, a, b, -g, f, (max_b - b) // f + 1)
+    f, g = g, f - g
+
+
+def iter_deposits(total):
+  """Iterates every pair of deposits that reaches a total.
+
+  Args:
+    total: The target balance to eventually reach.
+  Yields:
+    (a, b, n) for every solution from day 2 onward, from the latest day to
+    the earliest and then by increasing b.
+  """
+  for family in deposit_families(total):
+    for k in range(family.count):
+      yield (family.a + k * family.a_step, family.b + k * family.b_step,
+             family.n)
+
+
+def count_deposits(total):
+  """Counts the pairs of deposits that reach a total (from day 2 onward).
+
+  Args:
+    total: The target balance to eventually reach.
+  Returns:
+    The number of (a, b, n) solutions.
+  """
+  return sum(family.count for family in deposit_families(total))
+
+
+class DepositTable:
+  """Precomputed Fibonacci numbers and inverses for solving many totals.
+
+  Attributes:
+    days: A list of (fib(n), fib(n - 1), inverse of fib(n - 1) modulo fib(n))
+        tuples, where days[0] is for day 1.
+    limits: A list of the smallest total that can be reached on each day with
+        positive deposits (fib(n + 1)), for bisecting.
+  """
+
+  def __init__(self, max_total=0):
+    """
+    Args:
+      max_total: The largest total that will be solved. The table is
+          extended as needed if larger totals are solved later.
+    """
+    self.days = []
+    self.limits = []
+    self._arrays_cache = None
+    self._f, self._g = 1, 0
+    self.extend(max_total)
+
+  def extend(self, max_total):
+    """Adds days to the table until it covers a total.
+
+    Args:
+      max_total: The largest total that needs to be solved.
+    """
+    f, g = self._f, self._g
+    while f + g <= max_total:
+      n = len(self.days) + 1
+      self.days.append((f, g, fib_inverse(n, f, g)))
+      self.limits.append(f + g)
+      f, g = f + g, f
+    self._f, self._g = f, g
+
+  def find_deposits(self, total):
+    """Find the minimum deposit amounts to eventually reach a certain balance.
+
+    Same as find_deposits(), but using the table.
+
+    Args:
+      total: The target balance to eventually reach.
+    Returns:
+      (a, b, n) or None if it isn't possible.
+    """
+    self.extend(total)
+    for n in range(bisect.bisect_right(self.limits, total), 0, -1):
+      f, g, inverse = self.days[n - 1]
+      b = total * inverse % f or f
+      a = (total - g * b) // f
+      if a >= 1:
+        return (a, b, n)
+    return None
+
+  def find_deposits_array(self, totals):
+    """Find the minimum deposit amounts for an array of totals.
+
+    This is vectorized with NumPy. Each total is only solved modulo fib(n)
+    once, on the latest day it could reach. That product is estimated with
+    extended precision floats and then corrected with wrapping 64-bit
+    arithmetic, so it's exact as long as the platform's long double has a
+    64-bit mantissa (see can_vectorize()).
+
+    The earlier days follow without any more modular arithmetic (see
+    _find_deposits_block()), so each day down is just a couple of additions
+    on the totals that are still unsolved.
+
+    Args:
+      totals: An array of totals, each in the range of a signed 64-bit int.
+    Returns:
+      (a, b, n) arrays of the same length as totals. Totals that aren't
+      possible have n == 0.
+    """
+    import numpy as np
+    totals = np.asarray(totals, dtype=np.int64)
+    a = np.zeros_like(totals)
+    b = np.zeros_like(totals)
+    n = np.zeros_like(totals)
+    if len(totals):
+      self.extend(int(totals.max()))
+    # Work in blocks small enough to stay in the CPU cache between passes.
+    for start in range(0, len(totals), self.BLOCK_SIZE):
+      block = slice(start, start + self.BLOCK_SIZE)
+      self._find_deposits_block(totals[block], a[block], b[block], n[block])
+    return a, b, n
+
+  BLOCK_SIZE = 1 << 14
+
+  def _find_deposits_block(self, totals, a, b, n):
+    """Fills in the a, b and n arrays for a block of totals.
+
+    Say (x, y) are the deposits with the smallest positive y that reach a
+    total on day k, i.e. fib(k) * x + fib(k - 1) * y == total, but x < 1 so
+    they aren't valid. Since fib(k) == fib(k - 1) + fib(k - 2), the total is
+    also fib(k - 1) * (x + y) + fib(k - 2) * x, and adding fib(k - 1) to the
+    second deposit and subtracting fib(k - 2) from the first keeps it the
+    same. And since y <= fib(k), x > -fib(k - 1), so x + fib(k - 1) is
+    already the smallest positive second deposit for day k - 1. So each
+    total is solved modulo fib(k) only on its latest day, and then
+    (x, y) -> (x + y - fib(k - 2), x + fib(k - 1)) steps down a day.
+    """
+    import numpy as np
+    limits, fs, gs, inverses, cs, ratios = self._arrays()
+    # The latest day each total can reach (0 if it can't reach any).
+    latest = np.searchsorted(limits, totals, side='right')
+    top = int(latest.max())
+    if not top:
+      return
+    # Sort the totals by their latest day (a stable sort of small ints is a
+    # radix sort), so the ones that have joined by each day are a prefix.
+    order = np.argsort(top - latest.astype(np.uint8), kind='stable')
+    counts = np.bincount(latest, minlength=top + 1).tolist()
+    order = order[:len(order) - counts[0]]
+    first = latest[order] - 1
+    first_x, first_y = _first_deposits(totals[order], fs[first], gs[first],
+                                       inverses[first], cs[first],
+                                       ratios[first])
+    x = np.empty_like(first_x)
+    y = np.empty_like(first_y)
+    solved = np.empty(len(order), dtype=bool)
+    end = retired = 0
+    for day in range(top, 0, -1):
+      f, g, _ = self.days[day - 1]
+      # (x + y - g, x + f), in place. The arrays swap roles each day.
+      y[:end] += x[:end]
+      y[:end] -= g
+      x[:end] += f
+      x, y = y, x
+      if counts[day]:
+        new = slice(end, end + counts[day])
+        x[new] = first_x[new]
+        y[new] = first_y[new]
+        end = new.stop
+      np.greater_equal(x[:end], 1, out=solved[:end])
+      found = np.flatnonzero(solved[:end])
+      if not len(found):
+        continue
+      idx = order[found]
+      a[idx] = x[found]
+      b[idx] = y[found]
+      n[idx] = day
+      # Replace them with deposits for a total of 0, which stay unsolved as
+      # they step down (alternating between (-g, f) and (0, 0)).
+      x[found] = -g
+      y[found] = f
+      retired += len(found)
+      if end == len(order) and retired * 4 >= end:
+        # Once every total has joined, drop the solved ones when there are
+        # enough to be worth copying the rest.
+        # Unsolved deposits have x > -g and y >= 1, and the replacements
+        # alternate between (-g, f) and (0, 0).
+        keep = (x[:end] > -g) & (y[:end] > 0)
+        order, x, y = order[keep], x[:end][keep], y[:end][keep]
+        end = len(order)
+        retired = 0
+        if not end:
+          break
+
+  def _arrays(self):
+    """Gets the days that fit in an int64 as NumPy arrays.
+
+    Returns:
+      (limits, f, g, inverse, c, ratio) arrays, where c is
+      (g * inverse - 1) // f wrapped to an int64 and ratio is inverse / f as a
+      long double (see _first_deposits()).
+    """
+    import numpy as np
+    count = bisect.bisect_right(self.limits, INT64_MAX)
+    if self._arrays_cache is None or len(self._arrays_cache[0]) != count:
+      days = self.days[:count]
+      self._arrays_cache = (
+          np.array(self.limits[:count], dtype=np.int64),
+          np.array([f for f, _, _ in days], dtype=np.int64),
+          np.array([g for _, g, _ in days], dtype=np.int64),
+          np.array([inverse for _, _, inverse in days], dtype=np.int64),
+          np.array([((g * inverse - 1) // f + 2 ** 63) % 2 ** 64 - 2 ** 63
+                    for f, g, inverse in days], dtype=np.int64),
+          np.array([np.longdouble(inverse) / np.longdouble(f)
+                    for f, _, inverse in days], dtype=np.longdouble))
+    return self._arrays_cache
+
+
+def can_vectorize():
+  """Checks if NumPy is available for find_deposits_array()."""
+  try:
+    import numpy as np
+  except ImportError:
+    return False
+  return np.finfo(np.longdouble).nmant >= 63
+
+
+def _first_deposits(totals, f, g, inverse, c, ratio):
+  """Solves totals modulo fib(k) for DepositTable._find_deposits_block().
+
+  Args:
+    totals: An int64 array of totals.
+    f, g, inverse, c, ratio: Arrays of each total's fib(k), fib(k - 1), the
+        inverse of fib(k - 1) modulo fib(k), (fib(k - 1) * inverse - 1) //
+        fib(k) and inverse / fib(k) (see DepositTable._arrays()).
+  Returns:
+    (x, y) arrays where fib(k) * x + fib(k - 1) * y == total and y is the
+    smallest positive value that works.
+  """
+  import numpy as np
+  remainder = totals % f
+  # Estimate remainder * inverse // f with extended precision floats.
+  # Truncating a non-negative value is the same as flooring it (and much
+  # faster than np.floor() on long doubles).
+  quotient = (remainder.astype(np.longdouble) * ratio).astype(np.uint64)
+  # The estimate can be off by one either way, so the remainder (modulo
+  # 2 ** 64) is in [-f, 2f).
+  uf = f.view(np.uint64)
+  y = remainder.view(np.uint64) * inverse.view(np.uint64) - quotient * uf
+  low = y >= np.uint64(0) - uf
+  y = np.where(low, y + uf, y)
+  quotient -= low
+  high = y >= uf
+  y = np.where(high, y - uf, y)
+  quotient += high
+  y = y.view(np.int64)
+  # g * inverse == 1 + c * f, so
+  # g * y == remainder + f * (remainder * c - g * quotient), and x is
+  # totals // f - remainder * c + g * quotient. The products can overflow,
+  # but x fits in an int64, so wrapping arithmetic gets it exactly.
+  x = totals // f - remainder * c + quotient.view(np.int64) * g
+  zero = y == 0
+  y[zero] = f[zero]
+  x[zero] -= g[zero]
+  return x, y
+
+
+INT64_MAX = 2 ** 63 - 1
+
+
+def find_deposits_batch(totals, table=None):
+  """Find the minimum deposit amounts for many totals.
+
+  All totals share one table of Fibonacci numbers and inverses. Totals that
+  fit in a 64-bit int are solved with NumPy if possible.
+
+  Args:
+    totals: An iterable of target balances.
+    table: A DepositTable to reuse between batches.
+  Returns:
+    A list with (a, b, n) (as in find_deposits()) or None for each total.
+  """
+  totals = list(totals)
+  if table is None:
+    table = DepositTable()
+  if not can_vectorize():
+    return [table.find_deposits(total) for total in totals]
+  array = _int64_array(totals)
+  if array is None:
+    # Solve the ones that fit with NumPy and the rest in pure Python.
+    fits = [-INT64_MAX - 1 <= total <= INT64_MAX for total in totals]
+    small = iter(find_deposits_batch(
+        [total for total, fit in zip(totals, fits) if fit], table))
+    return [next(small) if fit else table.find_deposits(total)
+            for total, fit in zip(totals, fits)]
+  a, b, n = table.find_deposits_array(array)
+  results = list(zip(a.tolist(), b.tolist(), n.tolist()))
+  for i in (n == 0).nonzero()[0].tolist():
+    results[i] = None
+  return results
+
+
+def _int64_array(totals):
+  """Converts a list of totals to an int64 array, or None if any don't fit."""
+  import numpy as np
+  try:
+    # Converting the whole list at once is much faster than checking each
+    # total first.
+    return np.array(totals, dtype=np.int64)
+  except OverflowError:
+    return None
+
+
+def stream_deposits(infile, outfile, chunk_size=1 << 16):
+  """Solves a stream of totals as JSON lines.
+
+  Each input line is a JSON total, either an integer (or a string of digits)
+  or an object with a "total" key. Each output line is an object with the
+  total and either "a", "b", and "n" or an "error". Lines that aren't a valid
+  total (including floats and booleans, which aren't rounded) get an object
+  with just an "error" (in the same position), and the stream carries on.
+
+  Args:
+    infile: The file to read totals from.
+    outfile: The file to write results to.
+    chunk_size: The number of totals to solve as a batch.
+  """
+  table = DepositTable()
+
+  def flush(totals):
+    array = _int64_array(totals) if can_vectorize() else None
+    if array is not None:
+      import numpy as np
+      a, b, n = table.find_deposits_array(array)
+      rows = np.stack((array, a, b, n), axis=1)
+      impossible = (n == 0).nonzero()[0].tolist()
+
+      def values(start, end):
+        return rows[start:end].ravel().tolist()
+    else:
+      results = find_deposits_batch(totals, table)
+      impossible = [i for i, solution in enumerate(results)
+                    if solution is None]
+
+      def values(start, end):
+        return itertools.chain.from_iterable(
+            zip(totals[start:end], *zip(*results[start:end])))
+
+    lines = []
+    start = 0
+    for i in impossible + [len(totals)]:
+      # Format each run of solutions with one big % instead of a json.dumps()
+      # per line (the result is the same).
+      if i > start:
+        lines.append(_SOLUTION_FORMAT * (i - start) % tuple(values(start, i)))
+      if i < len(totals):
+        lines.append(json.dumps({'total': totals[i], 'error': 'Not possible'}) +
+                     '\n')
+      start = i + 1
+    outfile.write(''.join(lines))
+
+  while True:
+    lines = list(itertools.islice(infile, chunk_size))
+    if not lines:
+      break
+    if _DIGIT_LINES.fullmatch(''.join(lines)):
+      # The common case of plain positive numbers can be converted all at
+      # once.
+      flush(list(map(int, lines)))
+      continue
+    totals = []
+    for line in lines:
+      line = line.strip()
+      if not line:
+        continue
+      try:
+        totals.append(_parse_total(line))
+      except ValueError:
+        # Keep the output in the same order as the input.
+        flush(totals)
+        totals = []
+        outfile.write(
+            json.dumps({'error': 'Invalid total: {}'.format(line)}) + '\n')
+    flush(totals)
+
+
+# JSON integers (without leading zeros), one per line.
+_DIGIT_LINES = re.compile('(?:(?:0|[1-9][0-9]*)\n)*(?:0|[1-9][0-9]*)?')
+_SOLUTION_FORMAT = '{"total": %d, "a": %d, "b": %d, "n": %d}\n'
+
+
+def _parse_total(line):
+  """Parses a line of stream_deposits() input.
+
+  Raises:
+    ValueError: If it isn't an integer, a string of digits or an object with
+        one of those as its "total".
+  """
+  total = json.loads(line)
+  if isinstance(total, dict):
+    if 'total' not in total:
+      raise ValueError('No total')
+    total = total['total']
+  if isinstance(total, str) and re.fullmatch('-?[0-9]+', total):
+    return int(total)
+  if isinstance(total, int) and not isinstance(total, bool):
+    return total
+  raise ValueError('Not an integer')
+
+
+class Recurrence:
+  """A general linear recurrence deposit scheme.
+
+  The balance on day n is:
+
+  balance(n) = c1 * balance(n - 1) + ... + ck * balance(n - k) + deposit(n)
+
+  where deposits are only made on the first k days (and the balance before
+  day 1 is 0). The Fibonacci scheme is Recurrence((1, 1)).
+
+  If h(n) is the balance on day n when the only deposit is 1 on day 1, then
+  the balance is a linear combination of the deposits:
+
+  balance(n) = h(n) * deposit(1) + h(n - 1) * deposit(2) + ...
+               + h(n - k + 1) * deposit(k)
+
+  Attributes:
+    coefficients: The tuple (c1, ..., ck).
+  """
+
+  def __init__(self, coefficients):
+    """
+    Args:
+      coefficients: The recurrence coefficients (c1, ..., ck). These must be
+          non-negative with c1 >= 1 and a sum of at least 2 so the balance
+          grows every day.
+    """
+    self.coefficients = tuple(coefficients)
+    if (not self.coefficients or
+        any(c < 0 for c in self.coefficients) or
+        self.coefficients[0] < 1 or
+        sum(self.coefficients) < 2):
+      raise ValueError('Balance wouldn\'t grow: {}'.format(self.coefficients))
+
+  def __len__(self):
+    return len(self.coefficients)
+
+  def _step(self, weights):
+    """Gets the balance coefficients for the next day from the current day's.
+    """
+    return (sum(c * w for c, w in zip(self.coefficients, weights)),) + \
+        weights[:-1]
+
+  def balance_coefficients(self, n):
+    """Gets the coefficient of each deposit in the balance on day n.
+
+    This raises the recurrence's companion matrix to the power n - 1, so it
+    only takes O(k^3 log n) multiplications.
+
+    Args:
+      n: The day number.
+    Returns:
+      A tuple (h(n), h(n - 1), ..., h(n - k + 1)).
+    """
+    k = len(self)
+    if n < 1:
+      return (0,) * k
+    matrix = [list(self.coefficients)]
+    for i in range(k - 1):
+      matrix.append([int(j == i) for j in range(k)])
+    power = _matrix_power(matrix, n - 1)
+    # The coefficients on day 1 are (1, 0, ..., 0), so the answer is the first
+    # column.
+    return tuple(row[0] for row in power)
+
+  def balance(self, deposits, n):
+    """Gets the balance on day n for a list of k deposits."""
+    return sum(w * d for w, d in zip(self.balance_coefficients(n), deposits))
+
+  def find_deposits(self, total):
+    """Find the minimum deposit amounts to eventually reach a certain balance.
+
+    For the latest possible day, the deposits with the smallest last deposit
+    are chosen, then the smallest second to last deposit, etc.
+
+    Args:
+      total: The target balance to eventually reach.
+    Returns:
+      (deposits, n) where deposits is a tuple of the k deposits and n is the
+      number of days it will take to reach the total.
+    Raises:
+      ValueError: If it isn't possible to reach the total.
+    """
+    # The balance coefficients for each day, until the balance would be too
+    # high even if every deposit is 1.
+    days = [self.balance_coefficients(1)]
+    while True:
+      weights = self._step(days[-1])
+      if sum(weights) > total:
+        break
+      days.append(weights)
+
+    for n in range(len(days), 0, -1):
+      deposits = _solve_positive(days[n - 1], total)
+      if deposits is not None:
+        return (deposits, n)
+    raise ValueError('Not possible')
+
+
+def _matrix_power(matrix, power):
+  """Raises a square matrix (a list of lists) to a non-negative power."""
+  def multiply(x, y):
+    return [[sum(a * b for a, b in zip(row, col)) for col in zip(*y)]
+            for row in x]
+  size = len(matrix)
+  result = [[int(i == j) for j in range(size)] for i in range(size)]
+  while power:
+    if power & 1:
+      result = multiply(result, matrix)
+    matrix = multiply(matrix, matrix)
+    power >>= 1
+  return result
+
+
+def _solve_positive(weights, total):
+  """Finds positive integer solutions to a linear equation.
+
+  Args:
+    weights: The non-negative coefficients (w1, ..., wk).
+    total: The right-hand side.
+  Returns:
+    The positive solution (d1, ..., dk) to w1 * d1 + ... + wk * dk == total
+    with the smallest dk, then the smallest d(k-1), etc, or None if there
+    are no positive solutions.
+  """
+  # Substitute e = d - 1 to look for non-negative solutions instead.
+  solution = _solve_nonnegative(weights, total - sum(weights))
+  if solution is None:
+    return None
+  return tuple(e + 1 for e in solution)
+
+
+def _solve_nonnegative(weights, total):
+  """Same as _solve_positive() but for non-negative solutions."""
+  if total < 0:
+    return None
+  *rest, last = weights
+  if not rest:
+    if last == 0:
+      return (0,) if total == 0 else None
+    e, remainder = divmod(total, last)
+    return None if remainder else (e,)
+  if last == 0:
+    solution = _solve_nonnegative(rest, total)
+    return None if solution is None else solution + (0,)
+  if 0 in rest:
+    # Deposits that don't count towards the total are best left at 0.
+    nonzero = [i for i, w in enumerate(weights) if w]
+    solution = _solve_nonnegative([weights[i] for i in nonzero], total)
+    if solution is None:
+      return None
+    deposits = [0] * len(weights)
+    for i, e in zip(nonzero, solution):
+      deposits[i] = e
+    return tuple(deposits)
+  if len(weights) == 3:
+    return _solve_three(*weights, total)
+  if len(weights) > 3:
+    return _solve_lattice(weights, total)
+
+  # With two terms, the first has to make up the rest of the total, so the
+  # last term has to make up the remainder modulo the first's weight. Solve
+  # that congruence with a modular inverse; the smallest solution works as
+  # long as it doesn't overshoot the total.
+  first, = rest
+  common = math.gcd(last, first)
+  if total % common:
+    return None
+  modulus = first // common
+  e = (total // common) * mod_inverse(last // common, modulus) % modulus \
+      if modulus > 1 else 0
+  if last * e > total:
+    return None
+  return ((total - last * e) // first, e)
+
+
+def _solve_lattice(weights, total):
+  """Same as _solve_nonnegative() for four or more positive weights.
+
+  The integer solutions are a particular solution plus the lattice of integer
+  vectors orthogonal to the weights, and the non-negative ones are the lattice
+  points in a simplex. The lattice basis is LLL-reduced in coordinates scaled
+  so the simplex is roughly round, which makes it only a few basis vectors
+  across in its narrowest directions. The lattice points are then enumerated
+  one basis coefficient at a time, each over its exact range within the
+  simplex given the ones already chosen, so the search only follows branches
+  that reach the simplex (like Lenstra's algorithm).
+
+  The smallest last deposit is found by a binary search on an upper bound for
+  it (rescaling the last coordinate for the narrower simplex each time), and
+  then the remaining deposits are solved recursively.
+  """
+  point, basis = _integer_solutions(weights, total)
+  if point is None:
+    return None
+
+  def search(limit):
+    """Finds a solution with a last deposit of at most limit."""
+    scales = list(weights)
+    if limit is not None:
+      scales[-1] = max(scales[-1], total // max(limit, 1))
+    # Start from the last reduced basis, which is usually nearly reduced for
+    # the new scales too.
+    nonlocal basis
+    basis = reduced = _lll(basis, lambda u, v: sum(
+        s * s * a * b for s, a, b in zip(scales, u, v)))
+    # Each constraint (coefficients, constant) is coefficients . t +
+    # constant >= 0 for the basis coefficients t: every deposit is
+    # non-negative, and the last is at most the limit.
+    constraints = [([b[i] for b in reduced], point[i])
+                   for i in range(len(weights))]
+    if limit is not None:
+      constraints.append(([-b[-1] for b in reduced], limit - point[-1]))
+    t = _lattice_search(constraints, len(reduced))
+    if t is None:
+      return None
+    return [p + sum(c * b[i] for c, b in zip(t, reduced))
+            for i, p in enumerate(point)]
+
+  solution = search(None)
+  if solution is None:
+    return None
+  lo, hi = 0, solution[-1]
+  while lo < hi:
+    solution = search((lo + hi) // 2)
+    if solution is None:
+      lo = (lo + hi) // 2 + 1
+    else:
+      hi = solution[-1]
+  return _solve_nonnegative(weights[:-1], total - weights[-1] * lo) + (lo,)
+
+
+def _solve_three(w1, w2, w3, total):
+  """Same as _solve_nonnegative() for three positive weights.
+
+  Any (y, z) where w2 * y + w3 * z is congruent to the total modulo w1 gives a
+  solution as long as it's in the triangle y >= 0, z >= 0,
+  w2 * y + w3 * z <= total. Those (y, z) form a shifted 2D lattice, so this
+  reduces the lattice basis and then walks the lines parallel to the
+  shortest basis vector that cross the triangle, finding the best point on
+  each line directly. With a reduced basis there are only a few lines per
+  lattice point in the triangle, except when the weights are small compared
+  to the total, which _solve_lattice() handles instead.
+  """
+  g = math.gcd(math.gcd(w1, w2), w3)
+  if total % g:
+    return None
+  w1, w2, w3, total = w1 // g, w2 // g, w3 // g, total // g
+
+  # Basis of the lattice of (y, z) with w2 * y + w3 * z == 0 modulo w1, and
+  # a point in the shifted lattice for the total.
+  a = math.gcd(w1, w2)
+  m = w1 // a
+  inverse = mod_inverse(w2 // a, m) if m > 1 else 0
+  u = (-w3 * inverse % m if m > 1 else 0, a)
+  v = (m, 0)
+  z0 = total * mod_inverse(w3, a) % a if a > 1 else 0
+  y0 = (total - w3 * z0) // a * inverse % m if m > 1 else 0
+
+  # Lagrange-Gauss reduction, measuring in the scaled coordinates
+  # (w2 * y, w3 * z) where the triangle is isosceles.
+  def norm(p, q=None):
+    q = p if q is None else q
+    return w2 * w2 * p[0] * q[0] + w3 * w3 * p[1] * q[1]
+  if norm(u) < norm(v):
+    u, v = v, u
+  while True:
+    mu = (2 * norm(u, v) + norm(v)) // (2 * norm(v))
+    u = (u[0] - mu * v[0], u[1] - mu * v[1])
+    if norm(u) >= norm(v):
+      break
+    u, v = v, u
+
+  # phi is constant along lines parallel to v. Find the range of lines that
+  # cross the triangle from the values of phi at its corners, scaled by
+  # w2 * w3 to keep everything as integers.
+  def phi(p):
+    return v[1] * p[0] - v[0] * p[1]
+  corners = [0, v[1] * total * w3, -v[0] * total * w2]
+  start = phi((y0, z0)) * w2 * w3
+  step = phi(u) * w2 * w3
+  if step < 0:
+    start, step = -start, -step
+    corners = [-c for c in corners]
+  first = -((start - min(corners)) // step)  # ceiling
+  last = (max(corners) - start) // step
+  if last - first > 64:
+    # The triangle is wide compared to the lattice (a small weights, large
+    # total problem), so walking the lines would take too long.
+    return _solve_lattice((w1, w2, w3), total)
+
+  def bounds(offset, slope, lo, hi):
+    """Narrows [lo, hi] to the j where offset + j * slope >= 0."""
+    if slope > 0:
+      lo = max(lo, -(offset // slope))
+    elif slope < 0:
+      hi = min(hi, offset // -slope)
+    elif offset < 0:
+      hi = lo - 1
+    return lo, hi
+
+  best = None
+  for i in range(first, last + 1):
+    y, z = y0 + i * u[0], z0 + i * u[1]
+    lo, hi = -math.inf, math.inf
+    lo, hi = bounds(y, v[0], lo, hi)
+    lo, hi = bounds(z, v[1], lo, hi)
+    lo, hi = bounds(total - w2 * y - w3 * z, -(w2 * v[0] + w3 * v[1]), lo,
+                    hi)
+    if lo > hi:
+      continue
+    # z (then y) is linear along the line, so the best point is at one end.
+    if (v[1], v[0]) > (0, 0):
+      j = lo
+    else:
+      j = hi
+    point = (z + j * v[1], y + j * v[0])
+    if best is None or point < best:
+      best = point
+  if best is None:
+    return None
+  z, y = best
+  return ((total - w2 * y - w3 * z) // w1, y, z)
+
+
+def _integer_solutions(weights, total):
+  """Finds all the integer solutions to a linear equation.
+
+  Returns:
+    (point, basis) where the solutions to w1 * d1 + ... + wk * dk == total are
+    point plus the integer combinations of the k - 1 basis vectors, or
+    (None, None) if there are no integer solutions.
+  """
+  k = len(weights)
+  # Apply unimodular column operations to turn the weights into
+  # (g, 0, ..., 0), tracking them in the columns of a matrix that starts as
+  # the identity. Then the first column solves for g and the rest are
+  # orthogonal to the weights.
+  columns = [[int(i == j) for i in range(k)] for j in range(k)]
+  g = weights[0]
+  for j in range(1, k):
+    w = weights[j]
+    new_g, x, y = egcd(g, w)
+    columns[0], columns[j] = (
+        [x * a + y * b for a, b in zip(columns[0], columns[j])],
+        [w // new_g * a - g // new_g * b
+         for a, b in zip(columns[0], columns[j])])
+    g = new_g
+  if total % g:
+    return None, None
+  return [total // g * a for a in columns[0]], columns[1:]
+
+
+def _lll(basis, inner, delta=fractions.Fraction(3, 4)):
+  """LLL-reduces a lattice basis.
+
+  Args:
+    basis: A list of integer basis vectors.
+    inner: A function for the inner product of two vectors.
+    delta: The Lovasz condition parameter.
+  Returns:
+    The reduced basis.
+  """
+  basis = [list(b) for b in basis]
+  n = len(basis)
+  # Work from the Gram matrix of inner products, updating it along with the
+  # basis, so Gram-Schmidt only needs arithmetic on n * n numbers.
+  gram = [[inner(u, v) for v in basis] for u in basis]
+
+  def gram_schmidt():
+    mu = [[0] * n for _ in range(n)]
+    norms = []
+    for i in range(n):
+      for j in range(i):
+        mu[i][j] = (fractions.Fraction(gram[i][j]) - sum(
+            mu[j][l] * mu[i][l] * norms[l] for l in range(j))) / norms[j]
+      norms.append(fractions.Fraction(gram[i][i]) - sum(
+          mu[i][l] ** 2 * norms[l] for l in range(i)))
+    return mu, norms
+
+  mu, norms = gram_schmidt()
+  k = 1
+  while k < n:
+    for j in range(k - 1, -1, -1):
+      q = round(mu[k][j])
+      if q:
+        basis[k] = [a - q * b for a, b in zip(basis[k], basis[j])]
+        row = [a - q * b for a, b in zip(gram[k], gram[j])]
+        row[k] -= q * row[j]
+        gram[k] = row
+        for i in range(n):
+          gram[i][k] = row[i]
+        mu, norms = gram_schmidt()
+    if norms[k] >= (delta - mu[k][k - 1] ** 2) * norms[k - 1]:
+      k += 1
+    else:
+      basis[k - 1], basis[k] = basis[k], basis[k - 1]
+      gram[k - 1], gram[k] = gram[k], gram[k - 1]
+      for row in gram:
+        row[k - 1], row[k] = row[k], row[k - 1]
+      mu, norms = gram_schmidt()
+      k = max(k - 1, 1)
+  return basis
+
+
+def _lattice_search(constraints, m):
+  """Finds an integer point in a bounded polytope.
+
+  Args:
+    constraints: A list of (coefficients, constant) for the constraints
+        coefficients . t + constant >= 0 on the m variables t.
+    m: The number of variables.
+  Returns:
+    A list of the m integer values, or None if there isn't an integer point.
+  """
+  if m == 0:
+    return [] if all(c >= 0 for _, c in constraints) else None
+  bounds = _variable_range(constraints, m)
+  if bounds is None:
+    return None
+  lo, hi = math.ceil(bounds[0]), math.floor(bounds[1])
+  # Try values from the middle out, since the edges of the polytope are the
+  # least likely to have integer points.
+  middle = (lo + hi) // 2
+  values = itertools.chain.from_iterable(
+      (middle + i, middle - i - 1) for i in range(hi - middle + 1))
+  for value in values:
+    if value < lo:
+      continue
+    rest = _lattice_search([(a[:-1], c + a[-1] * value)
+                            for a, c in constraints], m - 1)
+    if rest is not None:
+      return rest + [value]
+  return None
+
+
+def _variable_range(constraints, m):
+  """Gets the range of the last variable over a bounded polytope.
+
+  The extremes are at vertices, so this solves for the vertex at each set of
+  m constraints that are tight together.
+
+  Args:
+    constraints: As for _lattice_search().
+    m: The number of variables.
+  Returns:
+    (lo, hi) as Fractions, or None if the polytope is empty.
+  """
+  lo = hi = None
+  for tight in itertools.combinations(constraints, m):
+    vertex = _solve_linear([a for a, _ in tight], [-c for _, c in tight])
+    if vertex is None:
+      continue
+    if all(sum(x * v for x, v in zip(a, vertex)) + c >= 0
+           for a, c in constraints):
+      if lo is None or vertex[-1] < lo:
+        lo = vertex[-1]
+      if hi is None or vertex[-1] > hi:
+        hi = vertex[-1]
+  return None if lo is None else (lo, hi)
+
+
+def _solve_linear(matrix, rhs):
+  """Solves a square linear system exactly, or returns None if singular."""
+  n = len(matrix)
+  rows = [[fractions.Fraction(x) for x in row] + [fractions.Fraction(y)]
+          for row, y in zip(matrix, rhs)]
+  for col in range(n):
+    pivot = next((r for r in range(col, n) if rows[r][col]), None)
+    if pivot is None:
+      return None
+    rows[col], rows[pivot] = rows[pivot], rows[col]
+    for r in range(n):
+      if r != col and rows[r][col]:
+        factor = rows[r][col] / rows[col][col]
+        rows[r] = [x - factor * y for x, y in zip(rows[r], rows[col])]
+  return [rows[i][n] / rows[i][i] for i in range(n)]
+
+
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('total', type=int, nargs='?', default=1_000_000,
                       help='Target balance')
-  args = parser.parse_args()
+  parser.add_argument('--stream', action='store_true',
+                      help='Read JSON totals from stdin (one per line) and '
+                           'write JSON results to stdout')
+  parser.add_argument('-c', '--count', action='store_true',
+                      help='Count all the ways to reach the total instead')
+  parser.add_argument('-r', '--recurrence',
+                      help='Comma-separated coefficients of a general '
+                           'recurrence to use instead of Fibonacci (e.g. '
+                           '1,1,1 for tribonacci)')
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
+
+  if args.stream:
+    stream_deposits(sys.stdin, sys.stdout)
+    return
+
+  if args.count:
+    print('Day\tFirst a\tFirst b\tWays')
+    print('---\t-------\t-------\t----')
+    families = [DepositFamily(*family) for family in resultcache.cached(
+        'mpmp6', __file__, {'total': args.total, 'count': True},
+        lambda: deposit_families(args.total), kind='jsonl',
+        enabled=not args.no_cache)]
+    for family in families:
+      print('{}\t{}\t{}\t{:,}'.format(family.n, family.a, family.b,
+                                       family.count))
+    print('{:,} ways'.format(sum(family.count for family in families)))
+    return
+
+  if args.recurrence:
+    try:
+      recurrence = Recurrence(int(c) for c in args.recurrence.split(','))
+    except ValueError as e:
+      parser.error(e)
+    try:
+      deposits, n = resultcache.cached(
+          'mpmp6', __file__,
+          {'total': args.total,
+           'recurrence': list(recurrence.coefficients)},
+          lambda: recurrence.find_deposits(args.total),
+          enabled=not args.no_cache)
+    except ValueError as e:
+      print(e)
+    else:
+      print('Day\tDeposit\tBalance')
+      print('---\t-------\t-------')
+      bals = []
+      for day in range(1, n + 1):
+        deposit = deposits[day - 1] if day <= len(deposits) else 0
+        bals.append(sum(c * bal for c, bal in zip(recurrence.coefficients,
+                                                  reversed(bals))) + deposit)
+        print('{}\t{}\t{:,}'.format(day, deposit or '', bals[-1]))
+    return
 
   try:
-    a, b, n = find_deposits(args.total)
+    a, b, n = resultcache.cached(
+        'mpmp6', __file__, {'total': args.total},
+        lambda: find_deposits(args.total), enabled=not args.no_cache)
   except ValueError as e:
     print(e)
   else:
@@ -102,3 +1173,7 @@ if __name__ == '__main__':
       if day >= len(bals):
         bals.append(bals[-2] + bals[-1])
       print('{}\t\t{:,}'.format(day, bals[day]))
+
+
+if __name__ == '__main__':
+  main()
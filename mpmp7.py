@@ -11,6 +11,13 @@ https://www.think-maths.co.uk/uniquedistance
 
 import argparse
 import collections.abc
+import functools
+import itertools
+import random
+import time
+
+import resultcache
+import searchstats
 
 
 def dist(p1, p2):
@@ -27,20 +34,58 @@ def dist(p1, p2):
   return pow(p1[0] - p2[0], 2) + pow(p1[1] - p2[1], 2)
 
 
+def _popcount(bits):
+  return bin(bits).count('1')
+
+
+@functools.lru_cache()
+def conflict_tables(n):
+  """Precomputes which cells conflict with each other on a NxN grid.
+
+  Cells are numbered in row-major order, so cell y * n + x is (y, x), and sets
+  of cells are bitmasks.
+
+  Args:
+    n: The side length, N.
+  Returns:
+    (by_distance, equidistant) where by_distance[c][d] is the bitmask of
+    cells at squared distance d from cell c (missing if none) and
+    equidistant[c1][c2] is the bitmask of cells at the same distance from
+    both c1 and c2.
+  """
+  cells = [(y, x) for y in range(n) for x in range(n)]
+  distances = [[dist(p1, p2) for p2 in cells] for p1 in cells]
+  by_distance = []
+  for row in distances:
+    masks = collections.defaultdict(int)
+    for c, d in enumerate(row):
+      masks[d] |= 1 << c
+    by_distance.append(dict(masks))
+  equidistant = [[sum(1 << c for c, (d1, d2) in enumerate(zip(row1, row2))
+                      if d1 == d2)
+                  for row2 in distances]
+                 for row1 in distances]
+  return by_distance, equidistant
+
+
 class Grid(collections.abc.Sequence):
   """A NxN grid with some number of counters on."""
 
-  def __init__(self, n, pieces=(), distances=None):
+  def __init__(self, n, pieces=(), distances=None, available=None):
     """
     Args:
       n: The side length, N.
       pieces: A list of (rol, col) tuples that are occupied by counters.
       distances: A set of the unique distances between the counters. If None,
           this will be calculated on demand.
+      available: A bitmask of the cells (numbered in row-major order) after
+          the last counter where another counter could still be placed with
+          unique distancing. If None, this will be calculated on demand.
     """
     self.n = n
     self._pieces = sorted(pieces)
     self._distances = distances
+    self._available = available
 
   def __getitem__(self, index):
     return self._pieces[index]
@@ -71,6 +116,27 @@ class Grid(collections.abc.Sequence):
     The next time distances are requested they will be recalculated.
     """
     self._distances = None
+    self._available = None
+
+  @property
+  def available(self):
+    """Gets the cells where another counter could be placed.
+
+    Returns:
+      A bitmask of the cells (numbered in row-major order) after the last
+      counter that have unique distancing to all the current counters.
+    """
+    if self._available is None:
+      self._available = 0
+      for y in range(self.n):
+        for x in range(self.n):
+          try:
+            self.calc_distances((y, x))
+          except AssertionError:
+            pass
+          else:
+            self._available |= 1 << (y * self.n + x)
+    return self._available
 
   def flip(self, axis):
     """Mirrors the grid across one of the axes.
@@ -132,32 +198,88 @@ class Grid(collections.abc.Sequence):
       distances.add(d)
     return distances
 
-  def moves(self):
+  def moves(self, most_constrained=False):
     """Gets all the possible places to put a counter with unique distancing.
 
+    Rather than checking every cell, this only tries the available cells and
+    works out which cells will still be available after each one from the
+    conflict_tables().
+
+    Args:
+      most_constrained: If True, yield the grids with the fewest available
+          cells first (otherwise they're in row-major order).
     Yields:
       New grids with an extra counter placed.
     """
-    for y in range(self.n):
-      for x in range(self.n):
-        try:
-          new_distances = self.calc_distances((y, x))
-        except:
-          pass
-        else:
-          yield Grid(self.n, self._pieces + [(y, x)], new_distances)
-
-  def solve(self):
+    by_distance, equidistant = conflict_tables(self.n)
+    cells = [y * self.n + x for y, x in self]
+    grids = []
+    available = self.available
+    while available:
+      cell = (available & -available).bit_length() - 1
+      available &= available - 1
+      piece = divmod(cell, self.n)
+      new_distances = set(self.distances)
+      # Only cells after this one (and still available) are candidates.
+      new_available = available
+      conflicts = by_distance[cell]
+      for d in self.distances:
+        new_available &= ~conflicts.get(d, 0)
+      for other in cells:
+        d = dist(piece, divmod(other, self.n))
+        new_distances.add(d)
+        for c in cells + [cell]:
+          new_available &= ~by_distance[c].get(d, 0)
+        new_available &= ~equidistant[cell][other]
+      grid = Grid(self.n, self._pieces + [piece], new_distances, new_available)
+      if most_constrained:
+        grids.append(grid)
+      else:
+        yield grid
+    grids.sort(key=lambda grid: _popcount(grid.available))
+    yield from grids
+
+  def solve(self, most_constrained=False, stats=None):
     """Gets all grids with N counters with unique distances.
 
+    Branches are cut as soon as there are fewer available cells than
+    counters still to place.
+
+    Args:
+      most_constrained: If True, try the placements that leave the fewest
+          available cells first.
+      stats: An optional searchstats.SearchStats to record the search in.
     Yields:
       New grids with N counters.
     """
+    if stats is not None:
+      yield from self._solve_with_stats(most_constrained, stats, 1.0)
+      return
     if len(self) == self.n:
       yield self
       return
-    for grid in self.moves():
-      yield from grid.solve()
+    if len(self) + _popcount(self.available) < self.n:
+      return
+    for grid in self.moves(most_constrained=most_constrained):
+      yield from grid.solve(most_constrained=most_constrained)
+
+  def _solve_with_stats(self, most_constrained, stats, weight):
+    """Same as solve(), but recording each node in stats.
+
+    Args:
+      weight: This grid's share of the whole search tree.
+    """
+    if len(self) == self.n:
+      stats.finish(weight)
+      yield self
+      return
+    if len(self) + _popcount(self.available) < self.n:
+      stats.prune('too few available cells', weight)
+      return
+    grids = list(self.moves(most_constrained=most_constrained))
+    weight = stats.expand(len(self), len(grids), weight)
+    for grid in grids:
+      yield from grid._solve_with_stats(most_constrained, stats, weight)
 
   def draw(self):
     """Prints a text image of this board."""
@@ -168,24 +290,200 @@ class Grid(collections.abc.Sequence):
       print(sep)
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+def local_search(n, seed=None, deadline=None, max_steps=10000):
+  """Searches for one unique distancing layout with tabu search.
+
+  Starting from random positions, each step moves one counter that shares a
+  distance with another to the empty cell that leaves the fewest colliding
+  distances. Moving a counter back to a cell it recently left is forbidden
+  for a while unless it would be the best layout yet.
+
+  Args:
+    n: The side length, N.
+    seed: The random seed.
+    deadline: A time.time() to give up at, or None.
+    max_steps: The number of steps to give up after.
+  Returns:
+    A Grid with N counters and unique distances, or None if one wasn't found.
+  """
+  rng = random.Random(seed)
+  cells = [(y, x) for y in range(n) for x in range(n)]
+  pieces = rng.sample(cells, n)
+  # How many times each distance occurs. The cost is the number of pairs of
+  # counters whose distance isn't unique.
+  counts = collections.Counter(dist(p1, p2)
+                               for p1, p2 in itertools.combinations(pieces, 2))
+  cost = sum(c - 1 for c in counts.values())
+  best_cost = cost
+  tabu = {}
+  for step in range(max_steps):
+    if not cost or (deadline is not None and time.time() > deadline):
+      break
+    occupied = set(pieces)
+    best_moves = []
+    best_delta = None
+    for i, piece in enumerate(pieces):
+      others = pieces[:i] + pieces[i + 1:]
+      old = [dist(piece, other) for other in others]
+      if all(counts[d] == 1 for d in old):
+        continue
+      # Take this counter off the board, counting collisions removed.
+      removed = 0
+      for d in old:
+        counts[d] -= 1
+        removed += counts[d] > 0
+      for cell in cells:
+        if cell in occupied:
+          continue
+        added = 0
+        extra = collections.Counter()
+        for other in others:
+          d = dist(cell, other)
+          added += counts[d] + extra[d] > 0
+          extra[d] += 1
+        delta = added - removed
+        if tabu.get((i, cell), -1) >= step and cost + delta >= best_cost:
+          continue
+        if best_delta is None or delta < best_delta:
+          best_delta = delta
+          best_moves = [(i, cell)]
+        elif delta == best_delta:
+          best_moves.append((i, cell))
+      for d in old:
+        counts[d] += 1
+    if not best_moves:
+      continue
+    i, cell = rng.choice(best_moves)
+    tabu[(i, pieces[i])] = step + n + rng.randrange(n)
+    for j, other in enumerate(pieces):
+      if j != i:
+        counts[dist(pieces[i], other)] -= 1
+        counts[dist(cell, other)] += 1
+    pieces[i] = cell
+    cost += best_delta
+    best_cost = min(best_cost, cost)
+
+  if cost:
+    return None
+  grid = Grid(n, pieces)
+  # Double check the incremental counts with the normal distance calculation.
+  if len(grid.distances) != n * (n - 1) // 2:
+    return None
+  return grid
+
+
+def _local_search_worker(args):
+  return local_search(*args)
+
+
+def find_layout(n, seed=None, time_limit=None, restarts=1, max_steps=10000,
+                processes=1):
+  """Runs local_search() with restarts until a layout is found.
+
+  Args:
+    n: The side length, N.
+    seed: The random seed used to pick the seed for each restart.
+    time_limit: The number of seconds to give up after, or None.
+    restarts: The number of times to run local_search().
+    max_steps: The number of steps for each local_search().
+    processes: The number of processes to run restarts in parallel with.
+  Returns:
+    A Grid with N counters and unique distances, or None if one wasn't found.
+  """
+  rng = random.Random(seed)
+  deadline = None if time_limit is None else time.time() + time_limit
+  jobs = [(n, rng.getrandbits(64), deadline, max_steps)
+          for _ in range(restarts)]
+  if processes > 1:
+    import multiprocessing
+    with multiprocessing.Pool(processes) as pool:
+      for grid in pool.imap_unordered(_local_search_worker, jobs):
+        if grid is not None:
+          return grid
+  else:
+    for job in jobs:
+      grid = local_search(*job)
+      if grid is not None:
+        return grid
+  return None
+
+
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
   parser.add_argument('n', type=int, nargs='?', default=6,
                       help='Size of grid and number of counters')
-  args = parser.parse_args()
-
+  parser.add_argument('-c', '--most-constrained', action='store_true',
+                      help='Try the most constrained placements first')
+  parser.add_argument('--stats', action='store_true',
+                      help='Print search progress and statistics to stderr')
+  parser.add_argument('--profile', metavar='FILE',
+                      help='Profile the search and write the stats to FILE')
+  parser.add_argument('-l', '--local-search', action='store_true',
+                      help='Find one layout with a randomized local search '
+                           'instead of finding all of them')
+  parser.add_argument('--seed', type=int,
+                      help='Random seed for the local search')
+  parser.add_argument('--time-limit', type=float,
+                      help='Seconds to give up the local search after')
+  parser.add_argument('--restarts', type=int, default=10,
+                      help='Number of local search restarts')
+  parser.add_argument('--max-steps', type=int, default=10000,
+                      help='Number of steps per local search restart')
+  parser.add_argument('-p', '--processes', type=int, default=1,
+                      help='Number of processes to run restarts in')
+  parser.add_argument('--no-cache', action='store_true',
+                      help='Don\'t use or store cached results')
+  args = parser.parse_args(argv)
+
+  if args.local_search:
+    grid = find_layout(args.n, seed=args.seed, time_limit=args.time_limit,
+                       restarts=args.restarts, max_steps=args.max_steps,
+                       processes=args.processes)
+    if grid is None:
+      print('No layout found')
+    else:
+      grid.draw()
+      print(sorted(grid.distances))
+    return
+
+  stats = searchstats.SearchStats() if args.stats else None
   solutions = []
   grid = Grid(args.n)
-  for solution in grid.solve():
-    if any(s.symmetrical(solution) for s in solutions):
-      continue
-    solutions.append(solution)
-    solution.draw()
-    distances = solution.distances
-    solution.reset_distances()
-    assert(distances == solution.distances)
-    assert(len(distances) == args.n * (args.n - 1) / 2)
-    print(sorted(distances))
-    print()
-    ## break
+
+  def compute():
+    return (list(solution) for solution in
+            grid.solve(most_constrained=args.most_constrained, stats=stats))
+
+  with searchstats.profiled(args.profile):
+    # Statistics and profiles are only useful if the search actually runs.
+    layouts = resultcache.cached(
+        'mpmp7', __file__,
+        {'n': args.n, 'most_constrained': args.most_constrained},
+        compute, kind='jsonl',
+        enabled=not (args.no_cache or args.stats or args.profile))
+    for pieces in layouts:
+      solution = Grid(args.n, map(tuple, pieces))
+      if any(s.symmetrical(solution) for s in solutions):
+        continue
+      solutions.append(solution)
+      solution.draw()
+      distances = solution.distances
+      solution.reset_distances()
+      assert(distances == solution.distances)
+      assert(len(distances) == args.n * (args.n - 1) / 2)
+      print(sorted(distances))
+      print()
+      ## break
+  if stats is not None:
+    stats.print_summary()
   print('{} unique solutions'.format(len(solutions)))
+
+
+if __name__ == '__main__':
+  main()
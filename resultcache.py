@@ -0,0 +1,258 @@
+"""
+**Result Cache**
+
+A persistent on-disk cache of puzzle results shared by all the command line
+tools, so repeating a query doesn't repeat the work.
+
+Each result is stored in its own file named by a hash of the module name, its
+normalized arguments and the module's source code, so changing the code
+automatically misses the old results. Files are written atomically (to a
+temporary file that is renamed into place), so concurrent processes never see
+a partial result, and the least recently used files are deleted once the
+cache grows past its size limit.
+
+Results are stored as JSON ("json"), JSON lines for lists of results
+("jsonl") or NumPy arrays ("npy"), which can be memory-mapped so large tables
+are shared between processes instead of loaded into each one.
+
+The cache is only an optimization: if it can't be written (e.g. the directory
+isn't writable), a warning is printed and the result is still returned.
+
+The cache directory is $MPMP_CACHE_DIR if set, or mpmp in the user's cache
+directory.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import re
+import sys
+
+
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+
+def default_directory():
+  """Gets the default cache directory."""
+  if 'MPMP_CACHE_DIR' in os.environ:
+    return os.environ['MPMP_CACHE_DIR']
+  base = os.environ.get('XDG_CACHE_HOME',
+                        os.path.join(os.path.expanduser('~'), '.cache'))
+  return os.path.join(base, 'mpmp')
+
+
+@functools.lru_cache()
+def _source_hash(path, mtime):
+  """Hashes a source file (mtime is only part of the cache key)."""
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_hash(path):
+  """Gets a hash of a source file's contents."""
+  path = os.path.abspath(path)
+  return _source_hash(path, os.stat(path).st_mtime_ns)
+
+
+class ResultCache:
+  """A size-bounded on-disk cache of results.
+
+  Attributes:
+    directory: The directory the results are stored in.
+    max_bytes: The total size the cache is trimmed to after each write.
+  """
+
+  KINDS = ('json', 'jsonl', 'npy')
+
+  # The names path() gives results. Nothing else in the directory is touched,
+  # in case it's shared with other files.
+  ENTRY_PATTERN = re.compile(r'.+-[0-9a-f]{64}\.(?:json|jsonl|npy)$')
+
+  def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Args:
+      directory: The cache directory (see default_directory()).
+      max_bytes: The total size the cache is trimmed to after each write.
+    """
+    self.directory = directory or default_directory()
+    self.max_bytes = max_bytes
+
+  def path(self, name, source, args, kind):
+    """Gets the file a result is stored in.
+
+    Args:
+      name: The module name.
+      source: The path of the module's source file.
+      args: A JSON-serializable description of the arguments.
+      kind: How the result is stored (one of KINDS).
+    """
+    if kind not in self.KINDS:
+      raise ValueError('Unknown kind: {}'.format(kind))
+    key = json.dumps([name, source_hash(source), args], sort_keys=True,
+                     separators=(',', ':'))
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(self.directory, '{}-{}.{}'.format(name, digest, kind))
+
+  def get(self, name, source, args, kind='json', mmap=False):
+    """Gets a cached result.
+
+    Args:
+      mmap: Whether to memory-map an "npy" result (read-only) instead of
+          reading it into memory.
+    Returns:
+      The result.
+    Raises:
+      KeyError: If it isn't cached.
+    """
+    path = self.path(name, source, args, kind)
+    try:
+      if kind == 'npy':
+        import numpy as np
+        value = np.load(path, mmap_mode='r' if mmap else None)
+      else:
+        with open(path) as f:
+          if kind == 'json':
+            value = json.load(f)
+          else:
+            value = [json.loads(line) for line in f]
+      # Mark it as recently used.
+      os.utime(path)
+    except (OSError, ValueError) as e:
+      # A missing file, one that was trimmed while reading or a cache
+      # directory that can't be read is a miss.
+      raise KeyError(path) from e
+    return value
+
+  def put(self, name, source, args, value, kind='json'):
+    """Stores a result (see get()).
+
+    Returns:
+      Whether it was stored. If the cache can't be written, a warning is
+      printed to stderr instead of raising an error.
+    """
+    path = self.path(name, source, args, kind)
+    import tempfile
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      try:
+        with os.fdopen(fd, 'wb' if kind == 'npy' else 'w') as f:
+          if kind == 'npy':
+            import numpy as np
+            np.save(f, value)
+          elif kind == 'json':
+            json.dump(value, f)
+          else:
+            for item in value:
+              f.write(json.dumps(item))
+              f.write('\n')
+        os.replace(temp_path, path)
+      except BaseException:
+        try:
+          os.unlink(temp_path)
+        except OSError:
+          pass
+        raise
+      self.trim()
+    except OSError as e:
+      print('Warning: not caching result: {}'.format(e), file=sys.stderr)
+      return False
+    return True
+
+  def cached(self, name, source, args, compute, kind='json', mmap=False):
+    """Gets a cached result, or computes and stores it.
+
+    Args:
+      name: The module name.
+      source: The path of the module's source file.
+      args: A JSON-serializable description of the arguments.
+      compute: A function with no arguments to compute the result.
+      kind: How the result is stored (one of KINDS).
+      mmap: Whether to memory-map an "npy" result (see get()).
+    Returns:
+      The result. For "jsonl" this is a list and for "npy" a NumPy array,
+      whether or not it was cached. A memory-mapped array is only in memory
+      if it couldn't be cached.
+    """
+    try:
+      return self.get(name, source, args, kind, mmap)
+    except KeyError:
+      pass
+    value = compute()
+    if kind == 'jsonl':
+      value = list(value)
+    elif kind == 'npy':
+      import numpy as np
+      value = np.asarray(value)
+    if self.put(name, source, args, value, kind) and mmap:
+      try:
+        # Map the stored copy so the computed one can be freed.
+        return self.get(name, source, args, kind, mmap)
+      except KeyError:
+        pass
+    return value
+
+  def trim(self):
+    """Deletes the least recently used results until the cache fits.
+
+    Only results are counted and deleted, not other files in the directory.
+    """
+    entries = []
+    total = 0
+    try:
+      names = os.listdir(self.directory)
+    except (FileNotFoundError, NotADirectoryError):
+      return
+    for filename in names:
+      if not self.ENTRY_PATTERN.match(filename):
+        continue
+      try:
+        stat = os.stat(os.path.join(self.directory, filename))
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime_ns, stat.st_size, filename))
+      total += stat.st_size
+    entries.sort()
+    for _, size, filename in entries:
+      if total <= self.max_bytes:
+        break
+      try:
+        os.unlink(os.path.join(self.directory, filename))
+      except FileNotFoundError:
+        pass
+      total -= size
+
+  def clear(self):
+    """Deletes every cached result."""
+    max_bytes, self.max_bytes = self.max_bytes, 0
+    try:
+      self.trim()
+    finally:
+      self.max_bytes = max_bytes
+
+
+def cached(name, source, args, compute, kind='json', enabled=True,
+           mmap=False):
+  """Gets a result from the default cache, or computes and stores it.
+
+  Args:
+    name: The module name.
+    source: The path of the module's source file.
+    args: A JSON-serializable description of the arguments.
+    compute: A function with no arguments to compute the result.
+    kind: How the result is stored (one of ResultCache.KINDS).
+    enabled: If False, just compute the result.
+    mmap: Whether to memory-map an "npy" result (see ResultCache.get()).
+  Returns:
+    The result (see ResultCache.cached()).
+  """
+  if not enabled:
+    value = compute()
+    if kind == 'jsonl':
+      value = list(value)
+    elif kind == 'npy':
+      import numpy as np
+      value = np.asarray(value)
+    return value
+  return ResultCache().cached(name, source, args, compute, kind, mmap)
@@ -0,0 +1,194 @@
+"""
+**Search Instrumentation**
+
+Opt-in statistics and profiling for the tree searches in the puzzle solvers
+(Triangle.solve() in mpmp5 and Grid.solve() in mpmp7).
+"""
+
+import collections
+import contextlib
+import sys
+import time
+
+
+class SearchStats:
+  """Collects statistics about a tree search as it runs.
+
+  The search calls expand() for each node it expands, finish() for each node
+  without children and prune() or hit() when it skips work. Every so often a
+  progress line is written with an ETA.
+
+  The ETA comes from splitting each node's share of the whole tree evenly
+  between its children: the shares of the nodes that are finished are the
+  estimated fraction of the tree that's done (like Knuth's estimator, but
+  accumulated over every path taken instead of random samples).
+
+  Attributes:
+    nodes: A Counter of the number of nodes expanded at each depth.
+    children: The total number of children of all expanded nodes.
+    prunes: A Counter of the number of nodes pruned for each reason.
+    hits: A Counter of the number of cache hits of each kind.
+    done: The estimated fraction of the tree that has been searched.
+  """
+
+  def __init__(self, interval=1.0, file=None, check_every=4096):
+    """
+    Args:
+      interval: Seconds between progress lines, or None for no progress.
+      file: The file to write progress to (defaults to stderr).
+      check_every: The number of nodes between checking the time.
+    """
+    self.nodes = collections.Counter()
+    self.children = 0
+    self.prunes = collections.Counter()
+    self.hits = collections.Counter()
+    self.done = 0.0
+    self.interval = interval
+    self.file = file
+    self.check_every = check_every
+    self._count = 0
+    self.start = time.perf_counter()
+    self._last_report = self.start
+
+  @property
+  def expanded(self):
+    """The total number of nodes expanded."""
+    return sum(self.nodes.values())
+
+  def expand(self, depth, children, weight):
+    """Records expanding a node.
+
+    Args:
+      depth: The depth of the node (the root is 0).
+      children: The number of children it has.
+      weight: The node's share of the whole tree.
+    Returns:
+      The share of the whole tree for each of its children.
+    """
+    self.nodes[depth] += 1
+    self.children += children
+    self._count += 1
+    if self._count >= self.check_every:
+      self._count = 0
+      self.check()
+    if not children:
+      self.done += weight
+      return 0.0
+    return weight / children
+
+  def finish(self, weight):
+    """Records a leaf node (a solution) that doesn't need expanding."""
+    self.done += weight
+
+  def prune(self, reason, weight=0.0):
+    """Records pruning a node.
+
+    Args:
+      reason: A description of why it was pruned.
+      weight: The node's share of the whole tree.
+    """
+    self.prunes[reason] += 1
+    self.done += weight
+
+  def hit(self, kind):
+    """Records a cache hit (work skipped because it was already done)."""
+    self.hits[kind] += 1
+
+  def elapsed(self):
+    return time.perf_counter() - self.start
+
+  def eta(self):
+    """Estimates the seconds remaining, or None if it can't yet."""
+    if self.done <= 0:
+      return None
+    return self.elapsed() * (1 - min(self.done, 1.0)) / self.done
+
+  def branching_factor(self):
+    """Gets the effective branching factor.
+
+    This is the b where a uniform tree with branching factor b and the same
+    depth would have the same number of nodes.
+    """
+    nodes = self.expanded
+    depth = max(self.nodes, default=0)
+    if nodes <= 1 or depth == 0:
+      return 0.0
+    lo, hi = 0.0, float(nodes)
+    for _ in range(100):
+      b = (lo + hi) / 2
+      if sum(b ** i for i in range(depth + 1)) < nodes:
+        lo = b
+      else:
+        hi = b
+    return (lo + hi) / 2
+
+  def check(self):
+    """Writes a progress line if it's been long enough since the last one."""
+    if self.interval is None:
+      return
+    now = time.perf_counter()
+    if now - self._last_report >= self.interval:
+      self._last_report = now
+      self.report()
+
+  def report(self):
+    """Writes a progress line."""
+    elapsed = self.elapsed()
+    eta = self.eta()
+    print('[{:.1f}s] {:,} nodes ({:,.0f}/s), depth {}, {:.1%} done, ETA {}'
+          .format(elapsed, self.expanded, self.expanded / max(elapsed, 1e-9),
+                  max(self.nodes, default=0), min(self.done, 1.0),
+                  '?' if eta is None else '{:.1f}s'.format(eta)),
+          file=self.file or sys.stderr, flush=True)
+
+  def summary(self):
+    """Gets the statistics as a dict."""
+    elapsed = self.elapsed()
+    return {
+        'seconds': elapsed,
+        'nodes': self.expanded,
+        'nodes_per_second': self.expanded / max(elapsed, 1e-9),
+        'nodes_per_depth': dict(sorted(self.nodes.items())),
+        'mean_children': self.children / max(self.expanded, 1),
+        'branching_factor': self.branching_factor(),
+        'prunes': dict(self.prunes),
+        'hits': dict(self.hits),
+    }
+
+  def print_summary(self, file=None):
+    """Writes the statistics."""
+    file = file or sys.stderr
+    summary = self.summary()
+    print('{:,} nodes in {:.2f}s ({:,.0f}/s)'.format(
+        summary['nodes'], summary['seconds'], summary['nodes_per_second']),
+        file=file)
+    print('Mean children {:.2f}, effective branching factor {:.2f}'.format(
+        summary['mean_children'], summary['branching_factor']), file=file)
+    print('Depth\tNodes', file=file)
+    for depth, nodes in summary['nodes_per_depth'].items():
+      print('{}\t{:,}'.format(depth, nodes), file=file)
+    for reason, count in summary['prunes'].items():
+      print('Pruned ({}): {:,}'.format(reason, count), file=file)
+    for kind, count in summary['hits'].items():
+      print('Hits ({}): {:,}'.format(kind, count), file=file)
+
+
+@contextlib.contextmanager
+def profiled(path):
+  """Profiles the code in the context with cProfile.
+
+  Args:
+    path: The file to write the stats to (readable with pstats), or None to
+        not profile.
+  """
+  if path is None:
+    yield
+    return
+  import cProfile
+  profile = cProfile.Profile()
+  profile.enable()
+  try:
+    yield
+  finally:
+    profile.disable()
+    profile.dump_stats(path)
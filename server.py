@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+
+"""
+**Query Server**
+
+A long-running server that answers puzzle queries, keeping the solvers'
+tables (Fibonacci numbers, tile combinations, jump and solved-position tables,
+distance tables) loaded between queries instead of rebuilding them in every
+process.
+
+Clients connect over a Unix socket or localhost TCP and send one JSON request
+per line, e.g.::
+
+  {"id": 1, "puzzle": "bank", "args": {"total": 1000000}}
+
+and get one JSON response per line (in the order they finish, so use the id
+to match them up)::
+
+  {"id": 1, "result": [144, 154, 19]}
+  {"id": 2, "error": "Not possible"}
+
+Cheap queries (and table lookups) are answered on the event loop. Searches,
+and queries whose arguments make them slow, are sent to a pool of worker
+processes with a time limit. Identical queries that are in flight at the same
+time share one computation and recent results are kept in memory, so repeated
+queries are answered without recomputing anything.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+
+
+def _train(distance=800, tank=500):
+  import mpmp2
+  if tank <= 0:
+    raise ValueError('tank must be positive')
+  return mpmp2.fuel_required(distance, tank)
+
+
+def _train_is_slow(distance=800, tank=500):
+  """Whether a train query needs a worker (see _train())."""
+  # fuel_required() takes about e ** (2 * distance / tank) steps.
+  return distance > 4 * tank
+
+
+def _scrabble(value=46, hand_size=7):
+  import mpmp3
+  return int(mpmp3.value_hands_fast(value, hand_size=hand_size))
+
+
+def _scrabble_is_slow(value=46, hand_size=7):
+  """Whether a scrabble query needs a worker (see _scrabble())."""
+  # value_hands_fast() tries every multiset of the ~10 point values, which is
+  # about 100,000 for 10 tiles and grows quickly after that.
+  return hand_size > 10
+
+
+def _cards(cards=4, up_or_down=False):
+  import mpmp4
+  winning = [0]
+  if up_or_down:
+    winning.append((1 << cards) - 1)
+  return mpmp4.solve_flips(cards, winning=winning)
+
+
+def _coins(rows=4, start=None, ignore_symmetry=False, macro=False,
+           shortest=False):
+  import mpmp5
+  tri = mpmp5.Triangle(rows, src=start)
+  if shortest:
+    solution = tri.shortest_solution(ignore_symmetry=ignore_symmetry)
+    return [solution] if solution else []
+  return tri.solve(ignore_symmetry=ignore_symmetry, macro=macro)
+
+
+def _build_coins_table(rows):
+  import mpmp5
+  mpmp5.load_table(rows)
+
+
+# Batches of more totals than this are solved in a worker process.
+BANK_BATCH_SIZE = 1024
+
+
+_deposit_table = None
+
+
+def _bank(total=1_000_000, totals=None, count=False, recurrence=None):
+  import mpmp6
+  global _deposit_table
+  if recurrence is not None:
+    deposits, n = mpmp6.Recurrence(recurrence).find_deposits(total)
+    return [list(deposits), n]
+  if count:
+    return [list(family) for family in mpmp6.deposit_families(total)]
+  if _deposit_table is None:
+    _deposit_table = mpmp6.DepositTable()
+  if totals is not None:
+    return mpmp6.find_deposits_batch(totals, _deposit_table)
+  solution = _deposit_table.find_deposits(total)
+  if solution is None:
+    raise ValueError('Not possible')
+  return solution
+
+
+def _bank_is_slow(total=1_000_000, totals=None, count=False,
+                  recurrence=None):
+  """Whether a bank query needs a worker (see _bank())."""
+  # Only the table lookups are quick. A general recurrence can take seconds
+  # per total and large batches add up.
+  return recurrence is not None or (totals is not None and
+                                    len(totals) > BANK_BATCH_SIZE)
+
+
+def _distance(n=6, most_constrained=False, local_search=False, seed=None,
+              time_limit=None, restarts=10, max_steps=10000):
+  import mpmp7
+  if local_search:
+    grid = mpmp7.find_layout(n, seed=seed, time_limit=time_limit,
+                             restarts=restarts, max_steps=max_steps)
+    return None if grid is None else list(grid)
+  solutions = []
+  for solution in mpmp7.Grid(n).solve(most_constrained=most_constrained):
+    if not any(s.symmetrical(solution) for s in solutions):
+      solutions.append(solution)
+  return [list(solution) for solution in solutions]
+
+
+# Puzzle: (function, whether it's slow enough to run in a worker process, or
+# a function of the query's arguments that says whether it is).
+HANDLERS = {
+    'train': (_train, _train_is_slow),
+    'scrabble': (_scrabble, _scrabble_is_slow),
+    'cards': (_cards, True),
+    'coins': (_coins, True),
+    'bank': (_bank, _bank_is_slow),
+    'distance': (_distance, True),
+}
+
+
+class QueryServer:
+  """Answers JSON puzzle queries.
+
+  Attributes:
+    processes: The number of worker processes for searches (None for one
+        per CPU).
+    memo_size: The number of recent results to keep.
+    timeout: The number of seconds a worker spends on a query before giving
+        up (None for no limit).
+  """
+
+  def __init__(self, processes=None, memo_size=1024, timeout=60):
+    self.processes = processes
+    self.memo_size = memo_size
+    self.timeout = timeout
+    self._pool = None
+    self._memo = collections.OrderedDict()
+    self._in_flight = {}
+    self._coins_tables = {}
+
+  @property
+  def pool(self):
+    """The worker process pool (started on first use)."""
+    if self._pool is None:
+      import concurrent.futures
+      self._pool = concurrent.futures.ProcessPoolExecutor(self.processes)
+    return self._pool
+
+  def close(self):
+    if self._pool is not None:
+      self._pool.shutdown()
+      self._pool = None
+
+  async def query(self, puzzle, args=None):
+    """Answers a query.
+
+    Args:
+      puzzle: The puzzle name (see HANDLERS), or "coins_table" to look up the
+          minimum moves and number of solutions from a precomputed table.
+      args: A dict of keyword arguments for the puzzle.
+    Returns:
+      The JSON-serializable result.
+    Raises:
+      ValueError: If the query isn't valid or has no answer.
+    """
+    args = args or {}
+    if not isinstance(args, dict):
+      raise ValueError('args must be an object')
+    key = json.dumps([puzzle, args], sort_keys=True)
+    if key in self._memo:
+      self._memo.move_to_end(key)
+      return self._memo[key]
+    if key not in self._in_flight:
+      self._in_flight[key] = asyncio.ensure_future(self._compute(puzzle, args))
+    future = self._in_flight[key]
+    try:
+      # Shielded so one client disconnecting doesn't cancel the others' query.
+      result = await asyncio.shield(future)
+    finally:
+      if future.done() and self._in_flight.get(key) is future:
+        del self._in_flight[key]
+    self._memo[key] = result
+    if len(self._memo) > self.memo_size:
+      self._memo.popitem(last=False)
+    return result
+
+  async def _compute(self, puzzle, args):
+    if puzzle == 'coins_table':
+      return await self._coins_table(**args)
+    if puzzle not in HANDLERS:
+      raise ValueError('Unknown puzzle: {}'.format(puzzle))
+    function, slow = HANDLERS[puzzle]
+    if callable(slow):
+      slow = slow(**args)
+    if not slow:
+      return _to_json(function(**args))
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(self.pool, _call, function, args,
+                                        self.timeout)
+    return _to_json(result)
+
+  async def _coins_table(self, rows=4, start=None):
+    """Looks up a start in mpmp5's table (built in a worker if needed)."""
+    import mpmp5
+    # Queries for different starts share one table, so they share one build
+    # (and not just the queries with the same key).
+    if rows not in self._coins_tables:
+      self._coins_tables[rows] = asyncio.ensure_future(
+          self._load_coins_table(rows))
+    future = self._coins_tables[rows]
+    try:
+      table = await asyncio.shield(future)
+    except Exception:
+      # Let a later query try again.
+      if self._coins_tables.get(rows) is future:
+        del self._coins_tables[rows]
+      raise
+    tri = mpmp5.Triangle(rows)
+    results = {}
+    for s in [start] if start else range(1, len(tri)):
+      entry = table[mpmp5.Triangle(tri, s).bits]
+      if entry['moves'] == mpmp5.UNSOLVABLE:
+        results[s] = None
+      else:
+        # Count removing the first coin as a move like solve() does.
+        results[s] = [int(entry['moves']) + 1, int(entry['solutions'])]
+    return results
+
+  async def _load_coins_table(self, rows):
+    """Builds and caches a table in a worker, then maps it in this process."""
+    import mpmp5
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(self.pool, _call, _build_coins_table,
+                               {'rows': rows}, self.timeout)
+    # Normally just maps the cached file, but off the event loop in case the
+    # cache couldn't be written and it has to be built again here.
+    return await loop.run_in_executor(None, mpmp5.load_table, rows)
+
+  async def handle_client(self, reader, writer):
+    """Answers each line of JSON from a client until it disconnects."""
+    lock = asyncio.Lock()
+    tasks = set()
+
+    async def answer(line):
+      response = {}
+      try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+          raise ValueError('Request must be an object')
+        response['id'] = request.get('id')
+        response['result'] = await self.query(request.get('puzzle'),
+                                              request.get('args'))
+      except Exception as e:
+        # Report bad queries (or bugs) to the client and keep serving.
+        response['error'] = str(e)
+      async with lock:
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        if line.strip():
+          task = asyncio.ensure_future(answer(line))
+          tasks.add(task)
+          task.add_done_callback(tasks.discard)
+      if tasks:
+        await asyncio.wait(tasks)
+    except ConnectionError:
+      pass
+    finally:
+      for task in tasks:
+        task.cancel()
+      writer.close()
+
+
+def _call(function, args, timeout=None):
+  """Calls a handler in a worker process.
+
+  Raises:
+    TimeoutError: If it takes longer than timeout seconds. The worker is then
+        free for the next query.
+  """
+  if timeout is None or not hasattr(signal, 'setitimer'):
+    return function(**args)
+
+  def expired(signum, frame):
+    raise TimeoutError('Gave up after {} seconds'.format(timeout))
+
+  # Workers run calls on their main thread, so an alarm can interrupt them.
+  previous = signal.signal(signal.SIGALRM, expired)
+  signal.setitimer(signal.ITIMER_REAL, timeout)
+  try:
+    return function(**args)
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous)
+
+
+def _to_json(value):
+  """Converts tuples (and NumPy values) to what they'll be once sent."""
+  return json.loads(json.dumps(value, default=int))
+
+
+async def serve(path=None, host='127.0.0.1', port=8765, processes=None,
+                memo_size=1024, timeout=60):
+  """Runs the server until cancelled.
+
+  Args:
+    path: The Unix socket to listen on, or None to use TCP.
+    host: The host to listen on for TCP.
+    port: The port to listen on for TCP.
+    processes: The number of worker processes for searches.
+    memo_size: The number of recent results to keep.
+    timeout: The number of seconds a worker spends on a query.
+  """
+  query_server = QueryServer(processes, memo_size, timeout)
+  try:
+    # Shut down cleanly (removing the socket) when terminated.
+    asyncio.get_event_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel)
+  except NotImplementedError:
+    pass
+  if path is not None:
+    _remove_stale_socket(path)
+    server = await asyncio.start_unix_server(query_server.handle_client, path)
+  else:
+    server = await asyncio.start_server(query_server.handle_client, host, port)
+  try:
+    async with server:
+      await server.serve_forever()
+  finally:
+    query_server.close()
+    if path is not None and os.path.exists(path):
+      os.unlink(path)
+
+
+def _remove_stale_socket(path):
+  """Removes a Unix socket left behind by a server that isn't running.
+
+  Raises:
+    OSError: If something else is at the path, or a server is listening on
+        it.
+  """
+  try:
+    mode = os.lstat(path).st_mode
+  except FileNotFoundError:
+    return
+  if not stat.S_ISSOCK(mode):
+    raise FileExistsError('{} exists and isn\'t a socket'.format(path))
+  with socket.socket(socket.AF_UNIX) as sock:
+    try:
+      sock.connect(path)
+    except OSError:
+      # Nothing is listening, so it's safe to replace.
+      os.unlink(path)
+      return
+  raise FileExistsError('A server is already listening on {}'.format(path))
+
+
+def query(puzzle, args=None, path=None, host='127.0.0.1', port=8765):
+  """Sends one query to a running server.
+
+  Returns:
+    The result.
+  Raises:
+    ValueError: If the server returned an error.
+  """
+  if path is not None:
+    sock = socket.socket(socket.AF_UNIX)
+    sock.connect(path)
+  else:
+    sock = socket.create_connection((host, port))
+  with sock, sock.makefile('rwb') as f:
+    f.write(json.dumps({'puzzle': puzzle, 'args': args or {}}).encode() + b'\n')
+    f.flush()
+    response = json.loads(f.readline())
+  if 'error' in response:
+    raise ValueError(response['error'])
+  return response['result']
+
+
+def main(argv=None, prog=None):
+  """Runs the command line interface.
+
+  Args:
+    argv: The command line arguments (defaults to sys.argv[1:]).
+    prog: The program name to show in help and errors.
+  """
+  parser = argparse.ArgumentParser(prog=prog)
+  parser.add_argument('-s', '--socket',
+                      help='Listen on this Unix socket instead of TCP')
+  parser.add_argument('--host', default='127.0.0.1',
+                      help='Host to listen on')
+  parser.add_argument('--port', type=int, default=8765,
+                      help='Port to listen on')
+  parser.add_argument('-p', '--processes', type=int,
+                      help='Number of worker processes for searches '
+                           '(defaults to one per CPU)')
+  parser.add_argument('--memo-size', type=int, default=1024,
+                      help='Number of recent results to keep in memory')
+  parser.add_argument('--timeout', type=float, default=60,
+                      help='Seconds a worker spends on a query before giving '
+                           'up (0 for no limit)')
+  parser.add_argument('-q', '--query', metavar='JSON',
+                      help='Send a request like {"puzzle": "bank", "args": '
+                           '{"total": 1000}} to a running server and print '
+                           'the result instead of serving')
+  args = parser.parse_args(argv)
+
+  if args.query:
+    request = json.loads(args.query)
+    try:
+      print(json.dumps(query(request.get('puzzle'), request.get('args'),
+                             path=args.socket, host=args.host,
+                             port=args.port)))
+    except ValueError as e:
+      print(e, file=sys.stderr)
+      return 1
+    return
+
+  try:
+    asyncio.run(serve(args.socket, args.host, args.port, args.processes,
+                      args.memo_size, args.timeout or None))
+  except (KeyboardInterrupt, asyncio.CancelledError):
+    pass
+  except OSError as e:
+    # E.g. the socket path or port is already in use.
+    print(e, file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())